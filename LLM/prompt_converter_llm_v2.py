@@ -1,14 +1,62 @@
 #!/usr/bin/env python3
 # prompt_converter_llm.py — minimal: sentence -> prompts (flat list)
-import os, re, json, requests
+import os, re, sys, json, time, queue, shutil, hashlib, threading, requests
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
 from flask import Flask, request, jsonify
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import re2  # google-re2: linear-time matching for patterns run on raw LLM output
+except Exception:
+    re2 = None
+
+try:
+    import orjson  # faster (de)serialization of Ollama requests/responses
+    _json_loads, _json_dumps = orjson.loads, orjson.dumps
+except Exception:
+    _json_loads = json.loads
+    _json_dumps = lambda obj: json.dumps(obj).encode("utf-8")
+
+try:
+    import diskcache  # optional persistent layer under the in-process prompt cache
+except Exception:
+    diskcache = None
+
+try:
+    import numpy as np
+    import faiss
+    from sentence_transformers import SentenceTransformer
+except Exception:
+    faiss = None
+
+try:
+    import ahocorasick  # pyahocorasick: multi-word scan for the hook/preposition cut
+except Exception:
+    ahocorasick = None
 
 # ---------- config ----------
 OLLAMA_URL     = os.getenv("OLLAMA_URL", "http://127.0.0.1:11434")
 OLLAMA_MODEL   = os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b-instruct")  # small+fast
 OLLAMA_TIMEOUT = int(os.getenv("OLLAMA_TIMEOUT", "180"))
+OLLAMA_KEEP_ALIVE = int(os.getenv("OLLAMA_KEEP_ALIVE", "-1"))   # -1: keep the model (and its KV prefix) loaded
 MAX_PREDICT    = int(os.getenv("CONVERTER_MAX_PREDICT", "24"))
 MAX_CTX        = int(os.getenv("CONVERTER_MAX_CTX", "192"))
+BIND           = os.getenv("CONVERTER_BIND", "0.0.0.0:5050")
+WORKERS        = int(os.getenv("CONVERTER_WORKERS", str(min(4, os.cpu_count() or 1))))  # sanitize path is CPU/GIL-bound
+THREADS        = int(os.getenv("CONVERTER_THREADS", "32"))           # concurrent in-flight Ollama calls per worker
+CACHE_SIZE     = int(os.getenv("CONVERTER_CACHE_SIZE", "4096"))
+CACHE_DIR      = os.getenv("CONVERTER_CACHE_DIR", "")          # e.g. /tmp/prompt_cache; empty = memory only
+CACHE_TTL      = int(os.getenv("CONVERTER_CACHE_TTL", "86400"))
+SEMANTIC_CACHE = os.getenv("CONVERTER_SEMANTIC_CACHE", "0") == "1"   # needs sentence-transformers + faiss
+SEMANTIC_MODEL = os.getenv("CONVERTER_SEMANTIC_MODEL", "all-MiniLM-L6-v2")
+SEMANTIC_MIN   = float(os.getenv("CONVERTER_SEMANTIC_MIN", "0.95"))   # cosine similarity for a hit
+SEMANTIC_MAX   = int(os.getenv("CONVERTER_SEMANTIC_MAX", "10000"))
+BATCH_ENABLED  = os.getenv("CONVERTER_BATCH", "0") == "1"         # coalesce concurrent Ollama calls
+BATCH_MAX      = int(os.getenv("CONVERTER_BATCH_MAX", "8"))
+BATCH_WINDOW   = float(os.getenv("CONVERTER_BATCH_WINDOW", "0.02"))  # seconds to wait for more requests
 
 SYSTEM_PROMPT = """
 You convert a short scene description into a SINGLE list of OWL-ViT prompts.
@@ -25,7 +73,10 @@ Rules (hard):
 - For “X with Y ...” patterns, keep the head X and convert Y into parts on that head, split on "and" and commas.
 - Do NOT output standalone parts without a head. E.g., from “bicycle with a frame” produce "a bicycle" and "a bicycle[frame]" (NOT "a frame").
 - If nothing valid is present, output {"texts":[[]]}.
-"""
+""".strip()   # byte-identical on every request so Ollama's prompt prefix cache hits
+
+# sorted keys, built once: every request sends the same options
+_OLLAMA_OPTIONS = {"num_ctx": MAX_CTX, "num_predict": MAX_PREDICT, "temperature": 0.1, "top_p": 0.8}
 
 
 
@@ -59,39 +110,58 @@ _PART_ONLY = {
 
 _CONTAINER_HEADS = {"box","bag","bottle","pack","carton"}
 
+# frozen + interned once: split() tokens are checked against these for every clause
+(_COLORS, _ADJ, _ART, _CONJ, _PRON, _PARTS_HOOKS, _REL_PREPS, _VERBS,
+ HUMANS, _STOP, _PART_ONLY, _CONTAINER_HEADS) = (
+    frozenset(sys.intern(w) for w in vocab)
+    for vocab in (_COLORS, _ADJ, _ART, _CONJ, _PRON, _PARTS_HOOKS, _REL_PREPS, _VERBS,
+                  HUMANS, _STOP, _PART_ONLY, _CONTAINER_HEADS)
+)
+
 _EOS_RE = re.compile(r'(?:</s>|<s>)', re.I)
 _CLAUSE_SPLIT_RE = re.compile(r"[.\n;]+|,+")
-_POSSESSIVE_RE = re.compile(r"\b([a-z]+)(?:'s)?\s+([a-z]+)\b", re.I)
-
-
-def _from_dict_items(texts_obj_list):
-    """
-    Accepts [{"text":"A black","head":"speaker"}, {"text":"A white","head":"mug"}]
-    → ["a speaker", "a mug"]
-
-    Also supports variants like {"head":"bicycle","part":"frame"} → ["a bicycle","a bicycle[frame]"].
-    """
-    out = []
-    for d in texts_obj_list or []:
-        if not isinstance(d, dict):
-            continue
-        head = (d.get("head") or d.get("object") or d.get("noun") or "").strip()
-        part = (d.get("part") or d.get("attribute") or d.get("affiliation") or "").strip()
-        if head:
-            out.append(f"a {head}")
-            if part:
-                out.append(f"a {head}[{part}]")
-    return out
-
-
+_NUM_RE          = re.compile(r"\b(\d+|zero|one|two|three|four|five|six|seven|eight|nine|ten)\b")
+_ENUM_PREFIX_RE  = re.compile(r"(?m)^\s*(\(?\d+\)?[\.\)]\s*)")
+_TRAILING_AND_RE = re.compile(r"\s+and\s*$")
+_WS_RE           = re.compile(r"\s+")
+_LINE_ENUM_RE    = re.compile(r'(?m)^\s*(?:\d+[\.\)]|-)\s*')
+_HOOK_WORDS = _PARTS_HOOKS | _REL_PREPS | {"of"}
+_HOOK_OR_PREP_RE = re.compile(rf"\b(?:{'|'.join(sorted(_HOOK_WORDS))})\b")
+# enumerator prefix | number word | trailing "and", in one scan (single-line input only)
+_CLEAN_RE = re.compile(
+    r"\A\s*\(?\d+\)?[\.\)]\s*"
+    r"|\b(?:\d+|zero|one|two|three|four|five|six|seven|eight|nine|ten)\b"
+    r"|\s+and\s*$"
+)
+
+# same words as _HOOK_OR_PREP_RE, as one automaton (used by _hook_start when installed)
+if ahocorasick is not None:
+    _HOOK_AC = ahocorasick.Automaton()
+    for _w in _HOOK_WORDS:
+        _HOOK_AC.add_word(_w, _w)
+    _HOOK_AC.make_automaton()
+else:
+    _HOOK_AC = None
+
+# scanned over raw LLM responses; RE2 when available so long/garbled output can't backtrack
+_JSON_OBJ_RE       = (re2 or re).compile(r"(?s)\{.*\}")
+_DOUBLE_BRACKET_RE = (re2 or re).compile(r"(?s)\[\s*\[.*?\]\s*\]")
+
+# tokens _head_only never accepts as a head
+_HEAD_REJECT = frozenset().union(_STOP, _PART_ONLY, _VERBS, _REL_PREPS, _ART, {"and"})
+
+
+@lru_cache(maxsize=2048)
 def _a_an(noun: str) -> str:
     noun = noun.strip()
     return ("an " if noun[:1] in "aeiou" else "a ") + noun
 
+_IRREGULAR = {"people":"person","men":"man","women":"woman","children":"child","mice":"mouse","bikes":"bicycle", "jeans":"jeans"}
+
+@lru_cache(maxsize=4096)
 def _singular(w: str) -> str:
-    irr = {"people":"person","men":"man","women":"woman","children":"child","mice":"mouse","bikes":"bicycle", "jeans":"jeans"}
     w = w.strip().lower()
-    if w in irr: return irr[w]
+    if w in _IRREGULAR: return _IRREGULAR[w]
     if w.endswith("ies"): return w[:-3]+"y"
     # if w.endswith("ses"): return w[:-2]
     if w.endswith("s") and not w.endswith("ss"): return w[:-1]
@@ -99,93 +169,74 @@ def _singular(w: str) -> str:
 
 def _clean_text(s: str) -> str:
     s = s.lower()
-    s = re.sub(r"(?m)^\s*(\(?\d+\)?[\.\)]\s*)", "", s)      # strip "1." "(2)" prefixes
-    s = re.sub(r"\s+and\s*$", "", s)                        # trailing 'and'
-    s = re.sub(r"\b(\d+|zero|one|two|three|four|five|six|seven|eight|nine|ten)\b", "", s)
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _ENUM_PREFIX_RE.sub("", s)      # strip "1." "(2)" prefixes
+    s = _TRAILING_AND_RE.sub("", s)     # trailing 'and'
+    s = _NUM_RE.sub("", s)
+    s = _WS_RE.sub(" ", s).strip()
     return s
 
-def _strip_eos(s: str) -> str:
-    return re.sub(r'\s+', ' ', _EOS_RE.sub('', s)).strip()
-
-def _drop_function_words(words: list[str]) -> list[str]:
-    bad = _ADJ | _ART | _PRON | _CONJ | _REL_PREPS | _VERBS
-    return [w for w in words if w not in bad]
+def _clean_text_fast(s: str) -> str:
+    """Same result as _clean_text, but one regex pass for the (usual) single-line case."""
+    if "\n" in s:
+        return _clean_text(s)
+    return " ".join(_CLEAN_RE.sub("", s.lower()).split())
 
-def _split_clauses(s: str) -> list[str]:
-    return [c.strip() for c in _CLAUSE_SPLIT_RE.split(s) if c.strip()]
-
-def _normalize_head(head: str) -> str | None:
-    h = _singular(head.lower().strip())
-    if h in HUMANS: h = "person"
-    if h in _STOP or h in _PART_ONLY:
+def _strip_eos(s: str) -> str:
+    return _WS_RE.sub(' ', _EOS_RE.sub('', s)).strip()
+
+def _is_word_char(c: str) -> bool:
+    return c.isalnum() or c == "_"
+
+def _hook_start(s: str) -> int:
+    """Index of the first whole-word hook/preposition in s (same as _HOOK_OR_PREP_RE), or -1."""
+    if _HOOK_AC is None:
+        m = _HOOK_OR_PREP_RE.search(s)
+        return m.start() if m else -1
+    best = -1
+    n = len(s)
+    for end, word in _HOOK_AC.iter(s):
+        start = end - len(word) + 1
+        if best != -1 and start >= best:
+            continue
+        if start > 0 and _is_word_char(s[start - 1]):
+            continue
+        if end + 1 < n and _is_word_char(s[end + 1]):
+            continue
+        best = start
+    return best
+
+@lru_cache(maxsize=4096)
+def _head_only(phrase: str) -> str | None:
+    """Head-only prompt for one phrase: "a black gun in the man's hand" -> "a gun"."""
+    s = _strip_eos(_clean_text_fast(phrase))
+    if not s:
         return None
-    return h
-
-def _possessive_pairs(s: str) -> list[tuple[str,str]]:
-    out = []
-    for left, right in _POSSESSIVE_RE.findall(s):
-        part = _singular(right.lower())
-        if part in _PART_ONLY:
-            head = _singular(left.lower())
-            if head in HUMANS: head = "person"
-            if head not in _STOP:
-                out.append((head, part))
-    return out
-
-def _head_from_phrase(s: str) -> str | None:
-    s = _clean_text(s)
-    if not s: return None
-    for cont in _CONTAINER_HEADS:
-        if re.search(rf"\b{cont}\s+of\b", s):
-            return cont
-    toks = _drop_function_words(s.split())
-    if not toks: return None
-    head = _singular(toks[-1])
-    if head in _STOP or head in _PART_ONLY:
+    # Strip any bracketed parts entirely: "a bicycle[frame]" -> "a bicycle"
+    if "[" in s:
+        s = s.split("[", 1)[0].strip()
+
+    # Prefer the head BEFORE any parts hook or relational preposition:
+    # e.g., "a gun in the man's hand" -> consider only "a gun"
+    cut = _hook_start(s)
+    if cut != -1:
+        s = s[:cut].strip()
+
+    # Drop leading article and adjectives/colors
+    toks = s.split()
+    if toks and toks[0] in _ART:
+        toks = toks[1:]
+    toks = [t for t in toks if t not in _ADJ]  # colors/adjectives
+    if not toks:
         return None
-    return head
 
+    # Choose the last valid token as head
+    for tok in reversed(toks):
+        head = _singular(tok)
+        if head and head not in _HEAD_REJECT:
+            return _a_an(head)
 
-def _parts_from_clause(clause: str) -> list[str]:
-    """Extract candidate parts only; ignore relations/pronouns/articles/adjectives."""
-    out = []
-    clause = _clean_text(clause)
-    if not clause: return out
-    # split on commas or 'and'
-    pieces = re.split(r"\s*(?:,| and )\s*", clause)
-    for p in pieces:
-        toks = _drop_function_words(p.split())
-        if not toks: continue
-        base = _singular(toks[-1])
-        if base in _PRON or base in _ART or base in _CONJ or base in _REL_PREPS or base in _STOP:
-            continue
-        out.append(base)
-    return out
+    return None
 
-def _drop_colors(s: str) -> str:
-    # remove leading color adjectives in head or part
-    # "a black speaker" -> "a speaker"
-    # "a suitcase[red label]" -> "a suitcase[label]"
-    try:
-        head, part = s, None
-        if "[" in s and s.endswith("]"):
-            head, part = s.split("[", 1)
-            part = part[:-1]  # drop trailing ]
-        # head
-        head_words = head.split()
-        if len(head_words) >= 2 and head_words[1].lower() in _COLORS:
-            head = head_words[0] + " " + " ".join(head_words[2:])
-        # part
-        if part:
-            pw = part.split()
-            if pw and pw[0].lower() in _COLORS:
-                part = " ".join(pw[1:])
-            s2 = head.strip() + "[" + part.strip() + "]"
-            return s2
-        return head.strip()
-    except Exception:
-        return s
 
 def sanitize_texts_llm(raw_groups: list[list[str]] | list[str], *, user_prompt: str = "") -> list[list[str]]:
     """
@@ -200,168 +251,281 @@ def sanitize_texts_llm(raw_groups: list[list[str]] | list[str], *, user_prompt:
     # ---- flatten incoming groups → simple list of strings ----
     if isinstance(raw_groups, list) and raw_groups and all(isinstance(x, str) for x in raw_groups):
         raw_groups = [raw_groups]  # type: ignore
-    flats: list[str] = []
-    for g in (raw_groups or []):
-        for p in (g or []):
-            if isinstance(p, str) and p.strip():
-                flats.append(p.strip())
-
-    # also add raw caption sentences/clauses as safety net
-    if user_prompt:
-        up = _strip_eos(_clean_text(user_prompt))
-        # if you already have _split_clauses, use it; else split on .,; and newlines
-        try:
-            flats.extend(_split_clauses(up))
-        except NameError:
-            flats.extend([seg.strip() for seg in re.split(r"[;\n\.]+", up) if seg.strip()])
-
-    # ---- head-only extractor ----
-    HOOK_OR_PREP_RE = re.compile(
-        rf"\b(?:{'|'.join(sorted((_PARTS_HOOKS | _REL_PREPS | {'of'})))})\b"
-    )
-
-    def _head_only(phrase: str) -> str | None:
-        s = _strip_eos(_clean_text(phrase))
-        if not s:
-            return None
-        # Strip any bracketed parts entirely: "a bicycle[frame]" -> "a bicycle"
-        if "[" in s:
-            s = s.split("[", 1)[0].strip()
-
-        # Prefer the head BEFORE any parts hook or relational preposition:
-        # e.g., "a gun in the man's hand" -> consider only "a gun"
-        m = HOOK_OR_PREP_RE.search(s)
-        if m:
-            s = s[:m.start()].strip()
-
-        # Drop leading article and adjectives/colors
-        toks = s.split()
-        if toks and toks[0] in _ART:
-            toks = toks[1:]
-        toks = [t for t in toks if t not in _ADJ]  # colors/adjectives
-        if not toks:
-            return None
-
-        # Choose the last valid token as head
-        for tok in reversed(toks):
-            head = _singular(tok)
-            if head and head not in _STOP and head not in _PART_ONLY and head not in _VERBS\
-               and head not in _REL_PREPS and head not in _ART and head != "and":
-                return _a_an(head)
-
-        return None
-
-    # ---- build deduped output (single group) ----
-    out: list[str] = []
-    seen = set()
-    for s in flats:
-        h = _head_only(s)
-        if h and h not in seen:
-            seen.add(h)
-            out.append(h)
-
-    return [out]
-
+    def _iter_flats():
+        for g in (raw_groups or []):
+            for p in (g or []):
+                if isinstance(p, str):
+                    p = p.strip()
+                    if p:
+                        yield p
+        # also add raw caption sentences/clauses as safety net
+        if user_prompt:
+            up = _strip_eos(_clean_text(user_prompt))
+            for seg in _CLAUSE_SPLIT_RE.split(up):
+                seg = seg.strip()
+                if seg:
+                    yield seg
+
+    # ---- build deduped output (single group, first-seen order) ----
+    return [list(dict.fromkeys(h for h in map(_head_only, _iter_flats()) if h))]
+
+
+def _flat_str(obj, out: list[str], stack: list) -> None:
+    out.append(obj)
+
+def _flat_dict(obj, out: list[str], stack: list) -> None:
+    head = (obj.get("head") or obj.get("object") or obj.get("noun") or "")
+    part = (obj.get("part") or obj.get("attribute") or obj.get("affiliation") or "")
+    if head:
+        head = head.strip()
+        if part and isinstance(part, str) and part.strip():
+            out.append(f"a {head}[{part.strip()}]")
+        out.append(f"a {head}")
+    # also dive into other dict values just in case
+    stack.extend(reversed(obj.values()))
+
+def _flat_seq(obj, out: list[str], stack: list) -> None:
+    stack.extend(reversed(obj))
+
+# exact-type dispatch; subclasses fall back to isinstance in _flatten_strings
+_FLAT_DISPATCH = {str: _flat_str, dict: _flat_dict, list: _flat_seq, tuple: _flat_seq}
 
 def _flatten_strings(obj) -> list[str]:
     """
-    Recursively pull out any strings from arbitrarily nested lists/tuples/dicts.
+    Pull out any strings from arbitrarily nested lists/tuples/dicts, depth-first in order.
     Also understands dicts like {"head":"bicycle","part":"frame"}.
     """
     out: list[str] = []
-    if obj is None:
-        return out
-
-    if isinstance(obj, str):
-        out.append(obj)
-        return out
-
-    if isinstance(obj, dict):
-        head = (obj.get("head") or obj.get("object") or obj.get("noun") or "")
-        part = (obj.get("part") or obj.get("attribute") or obj.get("affiliation") or "")
-        if head:
-            head = head.strip()
-            if part and isinstance(part, str) and part.strip():
-                out.append(f"a {head}[{part.strip()}]")
-            out.append(f"a {head}")
-        # also dive into other dict values just in case
-        for v in obj.values():
-            out.extend(_flatten_strings(v))
-        return out
-
-    if isinstance(obj, (list, tuple)):
-        for v in obj:
-            out.extend(_flatten_strings(v))
-        return out
-
-    # anything else → ignore
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        handler = _FLAT_DISPATCH.get(type(obj))
+        if handler is None:
+            if isinstance(obj, str):
+                handler = _flat_str
+            elif isinstance(obj, dict):
+                handler = _flat_dict
+            elif isinstance(obj, (list, tuple)):
+                handler = _flat_seq
+            else:
+                continue  # anything else → ignore
+        handler(obj, out, stack)
     return out
 
 
 def _strip_enumeration(s: str) -> str:
     # remove leading "1. ", "2) ", "- " at line starts
-    return re.sub(r'(?m)^\s*(?:\d+[\.\)]|-)\s*', '', s).strip()
+    if "\n" in s:
+        return _LINE_ENUM_RE.sub('', s).strip()
+    # single line: only the very start can carry an enumerator, no regex needed
+    t = s.lstrip()
+    if t[:1] == "-":
+        return t[1:].strip()
+    i, n = 0, len(t)
+    while i < n and t[i].isdecimal():
+        i += 1
+    if i and i < n and t[i] in ".)":
+        return t[i + 1:].strip()
+    return t.rstrip()
+
+# ---------- HTTP session (keep-alive to Ollama) ----------
+# Created lazily per process: a Session's pooled sockets must not be shared across a
+# gunicorn fork (e.g. with --preload), so a new pid gets a fresh one.
+_SESSION = None
+_SESSION_PID = None
+_SESSION_LOCK = threading.Lock()
+
+def _session() -> requests.Session:
+    global _SESSION, _SESSION_PID
+    if _SESSION_PID != os.getpid():
+        with _SESSION_LOCK:
+            if _SESSION_PID != os.getpid():
+                sess = requests.Session()
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=64,
+                                      max_retries=Retry(total=2, backoff_factor=0.2))
+                sess.mount("http://", adapter)
+                sess.mount("https://", adapter)
+                sess.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+                _SESSION, _SESSION_PID = sess, os.getpid()
+    return _SESSION
+
+# ---------- response cache ----------
+_DISK_CACHE = diskcache.Cache(CACHE_DIR) if (diskcache is not None and CACHE_DIR) else None
+# counters shared by all request threads; bump with _count()
+CACHE_STATS = {"disk_hits": 0, "semantic_hits": 0, "ollama_requests": 0, "ollama_batch_requests": 0,
+               "uncached_empty": 0}
+_STATS_LOCK = threading.Lock()
+
+def _count(name: str) -> None:
+    with _STATS_LOCK:
+        CACHE_STATS[name] += 1
+
+class _SemanticCache:
+    """
+    Nearest-neighbour cache over sentence embeddings, for captions that differ by a
+    few words ("a man holding a mug" vs "man holds mug"). LRU-evicted at max_items.
+    """
+    def __init__(self, model_name: str, min_sim: float, max_items: int):
+        self.model = SentenceTransformer(model_name)
+        dim = self.model.get_sentence_embedding_dimension()
+        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(dim))
+        self.items: OrderedDict[int, object] = OrderedDict()   # faiss id -> cached LLM result
+        self.min_sim = min_sim
+        self.max_items = max_items
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def _embed(self, text: str):
+        return self.model.encode([text], normalize_embeddings=True).astype(np.float32)
+
+    def get(self, text: str):
+        emb = self._embed(text)
+        with self.lock:
+            if not self.items:
+                return emb, None
+            scores, ids = self.index.search(emb, 1)
+            hit_id = int(ids[0][0])
+            if hit_id < 0 or scores[0][0] < self.min_sim or hit_id not in self.items:
+                return emb, None
+            self.items.move_to_end(hit_id)
+            return emb, self.items[hit_id]
+
+    def put(self, emb, value):
+        with self.lock:
+            item_id = self.next_id
+            self.next_id += 1
+            self.index.add_with_ids(emb, np.array([item_id], dtype=np.int64))
+            self.items[item_id] = value
+            if len(self.items) > self.max_items:
+                old_id, _ = self.items.popitem(last=False)
+                self.index.remove_ids(np.array([old_id], dtype=np.int64))
+
+_SEMANTIC = (_SemanticCache(SEMANTIC_MODEL, SEMANTIC_MIN, SEMANTIC_MAX)
+             if (SEMANTIC_CACHE and faiss is not None) else None)
+
+def _cache_key(prompt: str) -> str:
+    return hashlib.sha256(f"{OLLAMA_MODEL}|{SYSTEM_PROMPT}|{prompt}".encode("utf-8")).hexdigest()
+
+def cache_stats() -> dict:
+    info = _convert_prompt.cache_info()
+    with _STATS_LOCK:
+        counts = dict(CACHE_STATS)
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize,
+            "disk": _DISK_CACHE is not None, "semantic": _SEMANTIC is not None, **counts}
 
 # ---------- LLM call ----------
+class _Uncacheable(Exception):
+    """Carries a result _convert_prompt must not cache (lru_cache never caches a raise)."""
+    def __init__(self, result):
+        super().__init__("empty LLM result")
+        self.result = result
+
+def _has_texts(res) -> bool:
+    """False for the parse-failure fallback ([[]]) and other empty results."""
+    return isinstance(res, list) and any(res)
+
 def llm_convert_to_texts(sentence: str):
+    """Cached by normalized sentence; the returned lists are shared, so don't mutate them."""
+    try:
+        return _convert_prompt(_strip_enumeration(_strip_eos(sentence.strip())))
+    except _Uncacheable as e:
+        return e.result
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _convert_prompt(prompt: str):
+    if _DISK_CACHE is not None:
+        key = _cache_key(prompt)
+        res = _DISK_CACHE.get(key)
+        if _has_texts(res):   # skips empty entries pinned by older versions
+            _count("disk_hits")
+            return res
+    emb = None
+    if _SEMANTIC is not None:
+        emb, res = _SEMANTIC.get(prompt)
+        if res is not None:
+            _count("semantic_hits")
+            return res
+    res = _llm_generate(prompt)
+    if not _has_texts(res):
+        # garbled/empty reply: retry the LLM next time instead of pinning it in any cache
+        _count("uncached_empty")
+        raise _Uncacheable(res)
+    if _DISK_CACHE is not None:
+        _DISK_CACHE.set(key, res, expire=CACHE_TTL)
+    if _SEMANTIC is not None:
+        _SEMANTIC.put(emb, res)
+    return res
+
+def _ollama_generate(system: str, prompt: str, options: dict) -> str:
+    _count("ollama_requests")
     payload = {
         "model": OLLAMA_MODEL,
-        "system": SYSTEM_PROMPT,
-        "prompt": _strip_enumeration(_strip_eos(sentence.strip())),
+        "system": system,
+        "prompt": prompt,
         "stream": False,
         "format": "json",
-        "options": {"num_predict": MAX_PREDICT, "num_ctx": MAX_CTX, "temperature": 0.1, "top_p": 0.8},
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": options,
     }
-    r = requests.post(f"{OLLAMA_URL}/api/generate",
-                      data=json.dumps(payload),
-                      headers={"Content-Type":"application/json"},
-                      timeout=OLLAMA_TIMEOUT)
+    r = _session().post(f"{OLLAMA_URL}/api/generate", data=_json_dumps(payload), timeout=OLLAMA_TIMEOUT)
     r.raise_for_status()
-    txt = (r.json().get("response") or "").strip()
+    return (_json_loads(r.content).get("response") or "").strip()
 
-    def _try_parse(block: str) -> list[list[str]] | None:
-        try:
-            obj = json.loads(block)
-        except Exception:
-            return None
-        texts = obj.get("texts") if isinstance(obj, dict) else None
-        if not isinstance(texts, list):
-            return None
+def _llm_generate(prompt: str):
+    if BATCH_ENABLED:
+        return _submit_batched(prompt)
+    return _llm_generate_one(prompt)
+
+def _llm_generate_one(prompt: str):
+    return _parse_llm_text(_ollama_generate(SYSTEM_PROMPT, prompt, _OLLAMA_OPTIONS))
 
-        # 1) Already [["a …", …]]
-        if texts and isinstance(texts[0], list) and all(isinstance(x, str) for x in texts[0]):
-            return texts
+def _texts_from_obj(obj) -> list[list[str]] | None:
+    texts = obj.get("texts") if isinstance(obj, dict) else None
+    if not isinstance(texts, list):
+        return None
 
-        # 2) Flat ["a …", …]
-        if all(isinstance(x, str) for x in texts):
-            return [texts]
+    # 1) Already [["a …", …]]
+    if texts and isinstance(texts[0], list) and all(isinstance(x, str) for x in texts[0]):
+        return texts
 
-        # 3) Dict items [{"head":"…","part":"…"}, …]
-        if texts and isinstance(texts[0], dict):
-            flat = _flatten_strings(texts)
-            return [flat] if flat else [[]]
+    # 2) Flat ["a …", …]
+    if all(isinstance(x, str) for x in texts):
+        return [texts]
 
-        # 4) Arbitrary nested token soup → flatten all strings
+    # 3) Dict items [{"head":"…","part":"…"}, …]
+    if texts and isinstance(texts[0], dict):
         flat = _flatten_strings(texts)
         return [flat] if flat else [[]]
 
+    # 4) Arbitrary nested token soup → flatten all strings
+    flat = _flatten_strings(texts)
+    return [flat] if flat else [[]]
+
+def _try_parse(block: str) -> list[list[str]] | None:
+    try:
+        obj = _json_loads(block)
+    except Exception:
+        return None
+    return _texts_from_obj(obj)
+
+def _parse_llm_text(txt: str):
     # First pass: strict
     res = _try_parse(txt)
     if res is not None:
         return res
 
     # Find first JSON object
-    m = re.search(r"\{.*\}", txt, flags=re.S)
+    m = _JSON_OBJ_RE.search(txt)
     if m:
         res = _try_parse(m.group(0))
         if res is not None:
             return res
 
     # Find first [[...]]
-    m = re.search(r"\[\s*\[.*?\]\s*\]", txt, flags=re.S)
+    m = _DOUBLE_BRACKET_RE.search(txt)
     if m:
         try:
-            return json.loads(re.sub(r"'", '"', m.group(0)))
+            return json.loads(m.group(0).replace("'", '"'))
         except Exception:
             pass
 
@@ -369,6 +533,78 @@ def llm_convert_to_texts(sentence: str):
     # Return a structure compatible with sanitize_texts_llm input:
     return [[]]
 
+# ---------- request coalescing (CONVERTER_BATCH=1) ----------
+# Concurrent misses are queued and sent as ONE Ollama call per batch: the sentences go in
+# as a JSON array and the model answers with one {"texts":...} object per sentence.
+# Sentences the batch reply has no usable entry for are re-asked one by one with the
+# normal prompt, from the waiting request's thread, so the batcher is never held up.
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + """
+
+Batch mode: the input is a JSON array of N scene descriptions.
+Output {"results":[...]} with exactly N objects of the shape above, in input order."""
+_BATCH_OPTIONS = {"num_ctx": MAX_CTX * BATCH_MAX, "num_predict": MAX_PREDICT * BATCH_MAX,
+                  "temperature": 0.1, "top_p": 0.8}
+_PENDING: "queue.Queue[tuple[str, Future]]" = queue.Queue()
+_batcher_started = False
+_batcher_lock = threading.Lock()
+
+def _llm_generate_many(prompts: list[str]) -> list:
+    """
+    One Ollama call for the whole batch. Per prompt (in order): its parsed texts, or None
+    when the reply has no usable entry at that position (the caller re-asks it alone).
+    """
+    _count("ollama_batch_requests")
+    txt = _ollama_generate(BATCH_SYSTEM_PROMPT, json.dumps(prompts, ensure_ascii=False), _BATCH_OPTIONS)
+    try:
+        obj = _json_loads(txt)
+    except Exception:
+        obj = None
+    results = obj.get("results") if isinstance(obj, dict) else None
+    if not isinstance(results, list):
+        results = []
+    out = []
+    for i in range(len(prompts)):
+        res = _texts_from_obj(results[i]) if i < len(results) else None
+        out.append(res if _has_texts(res) else None)
+    return out
+
+def _batch_worker():
+    while True:
+        batch = [_PENDING.get()]
+        deadline = time.monotonic() + BATCH_WINDOW
+        while len(batch) < BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_PENDING.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            results = _llm_generate_many([p for p, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                fut.set_exception(e)
+            continue
+        for (_, fut), res in zip(batch, results):
+            fut.set_result(res)
+
+def _submit_batched(prompt: str):
+    global _batcher_started
+    if not _batcher_started:
+        # started lazily so each gunicorn worker gets its own thread after fork
+        with _batcher_lock:
+            if not _batcher_started:
+                threading.Thread(target=_batch_worker, name="ollama-batcher", daemon=True).start()
+                _batcher_started = True
+    fut: Future = Future()
+    _PENDING.put((prompt, fut))
+    res = fut.result(timeout=OLLAMA_TIMEOUT * 2)
+    if res is None:
+        # model ignored the batch shape for this sentence
+        res = _llm_generate_one(prompt)
+    return res
+
 
 
 # ---------- HTTP ----------
@@ -397,8 +633,36 @@ def prompts_only():
 
 @app.route("/health", methods=["GET"])
 def health():
-    return {"ok": True}, 200
+    return {"ok": True, "cache": cache_stats()}, 200
+
+def _bench_head_reject(n: int = 200_000) -> None:
+    """`python prompt_converter_llm_v2.py --bench`: one _HEAD_REJECT lookup vs the old six, per container type."""
+    import timeit
+    toks = ["chair", "floor", "frame", "holding", "on", "the", "and", "mug"] * 4
+    as_set, as_dict = set(_HEAD_REJECT), dict.fromkeys(_HEAD_REJECT, True)
+    cases = {
+        "six lookups": lambda: [t for t in toks if t not in _STOP and t not in _PART_ONLY and t not in _VERBS
+                                and t not in _REL_PREPS and t not in _ART and t != "and"],
+        "frozenset":   lambda: [t for t in toks if t not in _HEAD_REJECT],
+        "set":         lambda: [t for t in toks if t not in as_set],
+        "dict.get":    lambda: [t for t in toks if not as_dict.get(t)],
+    }
+    for name, fn in cases.items():
+        print(f"{name:12s} {timeit.timeit(fn, number=n // len(toks)) * 1e9 / n:6.1f} ns/token")
+
 
 if __name__ == "__main__":
-    # dev server (use gunicorn in production)
-    app.run(host="0.0.0.0", port=5050, debug=False)
+    if sys.argv[1:2] == ["--bench"]:
+        _bench_head_reject()
+        sys.exit(0)
+    # /prompts is I/O-bound on Ollama and the sanitizer is GIL-bound: serve it with several
+    # gunicorn gthread worker processes (SO_REUSEPORT) so slow captions overlap and the CPU
+    # work spreads across cores; fall back to the threaded dev server.
+    gunicorn = shutil.which("gunicorn")
+    if gunicorn:
+        here = os.path.dirname(os.path.abspath(__file__))
+        os.execv(gunicorn, [gunicorn, "-k", "gthread", "-w", str(WORKERS), "--threads", str(THREADS),
+                            "--timeout", str(OLLAMA_TIMEOUT + 10), "-b", BIND, "--reuse-port",
+                            "--chdir", here, "wsgi:app"] + sys.argv[1:])
+    host, _, port = BIND.rpartition(":")
+    app.run(host=host or "0.0.0.0", port=int(port), debug=False, threaded=True)
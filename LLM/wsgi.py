@@ -0,0 +1,2 @@
+# wsgi.py — WSGI entry point: gunicorn -k gthread -w 4 --threads 32 --reuse-port wsgi:app
+from prompt_converter_llm_v2 import app  # noqa: F401
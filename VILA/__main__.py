@@ -13,18 +13,27 @@ Changes for new architecture:
   to a local comm-manager endpoint on every generation.
 """
 
+import io
 import os
 import sys
 import time
-import json
+import atexit
 import signal
 import logging
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
-import urllib.request, urllib.error
 from urllib.parse import urlparse
 
-from termcolor import cprint
+import requests
+from requests.adapters import HTTPAdapter
+
+# json_helper.py sits one level up: the repo root for a checkout, nano_llm/ for the container copy
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from json_helper import dumps as _json_dumpb, loads as _json_loadb, orjson
+
+from termcolor import colored, cprint
 import numpy as np
 
 # NanoLLM stack (assumes your existing environment)
@@ -32,30 +41,29 @@ from nano_llm import NanoLLM, ChatHistory, ChatTemplates, BotFunctions
 from nano_llm.utils import ImageExtensions, ArgParser, KeyboardInterrupt, load_prompts, print_table
 
 # ---------------------------
-# Lightweight HTTP client (stdlib)
+# Lightweight HTTP client (keep-alive session)
 # ---------------------------
-import urllib.request
-import urllib.error
+
+# One pooled session for every notify POST, so the TCP connection to the
+# comm-manager is reused instead of re-opened per generation.
+NOTIFY_SESSION = requests.Session()
+NOTIFY_SESSION.headers["Content-Type"] = "text/plain; charset=utf-8"
+NOTIFY_SESSION.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+NOTIFY_SESSION.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+# Notifies run here so the comm-manager round-trip never delays the next prompt/response;
+# in-flight posts are drained at exit.
+NOTIFY_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="notify")
+atexit.register(NOTIFY_POOL.shutdown, wait=True)
 
 def _http_post_text(url: str, text: str, timeout: float = 6.0) -> tuple[int, str]:
     """
     POST plain text to 'url' as text/plain; utf-8.
     Returns: (status_code, response_text) or (-1, err) on network errors.
     """
-    req = urllib.request.Request(
-        url=url,
-        data=(text or "").encode("utf-8"),
-        headers={"Content-Type": "text/plain; charset=utf-8"},
-        method="POST",
-    )
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            status = getattr(resp, "status", 200)
-            body = resp.read().decode("utf-8", errors="replace")
-            return status, body
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8", errors="replace") if e.fp else str(e)
-        return e.code, body
+        resp = NOTIFY_SESSION.post(url, data=(text or "").encode("utf-8"), timeout=timeout)
+        return resp.status_code, resp.content.decode("utf-8", errors="replace")
     except Exception as e:
         return -1, str(e)
 
@@ -63,26 +71,21 @@ def _http_post_text(url: str, text: str, timeout: float = 6.0) -> tuple[int, str
 # Helpers for JSON by image (local only)
 # ---------------------------
 
+_IMG_EXT_SET = frozenset(
+    e if e.startswith(".") else f".{e}"
+    for e in (ImageExtensions if isinstance(ImageExtensions, (list, set, tuple)) else ())
+) or frozenset({".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff", ".tif", ".gif"})  # fallback if ImageExtensions is not provided
+
 def _ext_of(path: str) -> str:
     """Return the lowercase extension of a local path or URL."""
     p = path.strip().strip("'").strip('"')
-    if p.lower().startswith(("http://", "https://")):
-        parsed = urlparse(p)
-        _, ext = os.path.splitext(parsed.path)
-        return ext.lower()
-    _, ext = os.path.splitext(p)
-    return ext.lower()
+    if "://" in p and p.lower().startswith(("http://", "https://")):
+        return os.path.splitext(urlparse(p).path)[1].lower()  # path only: not ?query / #fragment
+    return os.path.splitext(p)[1].lower()
 
 def _is_image_path_or_url(user_text: str) -> bool:
     """Detect if the user_text looks like an image path or image URL."""
-    if not user_text:
-        return False
-    ext = _ext_of(user_text)
-    normalized = {e if e.startswith(".") else f".{e}" for e in (ImageExtensions if isinstance(ImageExtensions, (list, set, tuple)) else [])}
-    if not normalized:
-        # Fallback if ImageExtensions is not provided
-        normalized = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tiff", ".tif", ".gif"}
-    return ext in normalized
+    return bool(user_text) and _ext_of(user_text) in _IMG_EXT_SET
 
 def _json_path_for_image(image_path_or_url: str) -> str:
     """Return the JSON filename that corresponds to the image (next to it or derived from URL)."""
@@ -111,16 +114,27 @@ parser.add_argument("--enable-tools", action="store_true", help="allow tool/func
 parser.add_argument("--disable-automatic-generation", action="store_false", dest="automatic_generation", help="wait for 'generate' command")
 parser.add_argument("--disable-streaming", action="store_true", help="disable token streaming output")
 parser.add_argument("--disable-stats", action="store_true", help="suppress generation performance stats")
+parser.add_argument("--stats-every", type=int, default=None,
+                    help="print the stats table every N generations (default: 10 with --server, else 1)")
 
 # Save JSON by image toggles (local only)
 parser.add_argument("--save-json-by-image", action="store_true",
                     help="After each bot reply, append JSON bound to the last image path/URL provided in chat. JSON filename is <image_path>.json")
 parser.add_argument("--json-indent", type=int, default=2, help="Indentation for JSON (0 to minify)")
+parser.add_argument("--json-format", choices=("json", "jsonl"), default="json",
+                    help="'json': rewrite <image>.json per reply (read by display_server). "
+                         "'jsonl': append one line per reply to <image>.jsonl (header line first); "
+                         "use load_json_by_image() to get the old dict shape back")
+parser.add_argument("--json-flush-interval", type=float, default=2.0,
+                    help="jsonl mode: buffered lines reach disk within about N seconds, also when "
+                         "no further reply comes (always on exit); 0 = every reply")
 
 # HTTP server mode
 parser.add_argument("--server", action="store_true",
                     help="Run as HTTP server that accepts image_path/question and triggers VILA, saving JSON per image like CLI.")
 parser.add_argument("--port", type=int, default=8080, help="Port for --server mode (default: 8080)")
+parser.add_argument("--server-threads", type=int, default=4,
+                    help="HTTP worker threads for --server mode (inference is still serialized by _run_lock)")
 
 # NEW: notify comm-manager (message-only)
 parser.add_argument(
@@ -139,6 +153,9 @@ tool_response = None
 # Track the most recent image the user provided (used for JSON filename)
 last_image_path = None
 
+# ANSI prefix/reset for --reply-color, resolved once (empty when termcolor disables color)
+_REPLY_PFX, _REPLY_SFX = colored("\0", args.reply_color).split("\0")
+
 # ---------------------------
 # Load Model
 # ---------------------------
@@ -163,6 +180,51 @@ chat_history = ChatHistory(model, args.chat_template, args.system_prompt)
 # Append (local JSON only)
 # ---------------------------
 
+# json_path -> (st_ino, st_size, st_mtime_ns, indent, offset just past the last entry, tail bytes).
+# Lets the next append pwrite ",<record><tail>" at that offset instead of parsing and
+# rewriting the whole file. Any outside change (e.g. the capture sidecar writer) alters
+# the stat fingerprint and sends that append back through the full rewrite.
+_JSON_TAIL: dict[str, tuple] = {}
+
+def _remember_json_tail(json_path: str, data: bytes, indent) -> None:
+    close = data.rfind(b"]")
+    last = data.rfind(b"}", 0, close) + 1
+    if close < 0 or last <= 0 or data[last:close].strip() or data[close + 1:].strip() != b"}":
+        _JSON_TAIL.pop(json_path, None)
+        return
+    st = os.stat(json_path)
+    _JSON_TAIL[json_path] = (st.st_ino, st.st_size, st.st_mtime_ns, indent, last, data[last:])
+
+def _splice_entry_into_json(json_path: str, record: dict, indent) -> bool:
+    cached = _JSON_TAIL.get(json_path)
+    if cached is None:
+        return False
+    ino, size, mtime_ns, c_indent, last, tail = cached
+    try:
+        st = os.stat(json_path)
+    except OSError:
+        st = None
+    if st is None or c_indent != indent or (st.st_ino, st.st_size, st.st_mtime_ns) != (ino, size, mtime_ns):
+        _JSON_TAIL.pop(json_path, None)
+        return False
+
+    # same bytes a full rewrite would produce: entries sit two levels deep;
+    # compact output is "," for orjson and ", " for stdlib json
+    if indent is not None:
+        sep = b"\n" + b" " * (2 * indent)
+    else:
+        sep = b"" if orjson is not None else b" "
+    rec = _json_dumpb(record, indent).replace(b"\n", sep)
+    patch = b"," + sep + rec + tail
+    fd = os.open(json_path, os.O_WRONLY)
+    try:
+        os.pwrite(fd, patch, last)
+        st = os.fstat(fd)
+    finally:
+        os.close(fd)
+    _JSON_TAIL[json_path] = (st.st_ino, st.st_size, st.st_mtime_ns, indent, last + len(patch) - len(tail), tail)
+    return True
+
 def _append_entry_to_json(
     json_path: str,
     image_path_or_url: str,
@@ -181,11 +243,15 @@ def _append_entry_to_json(
         "response": reply_text,
     }
 
+    if _splice_entry_into_json(json_path, record, indent):
+        cprint(f"[saved] {json_path}", "cyan")
+        return
+
     doc = None
     if os.path.exists(json_path):
         try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                doc = json.load(f)
+            with open(json_path, "rb") as f:
+                doc = _json_loadb(f.read())
         except Exception:
             doc = None
 
@@ -197,22 +263,156 @@ def _append_entry_to_json(
             "entries": []
         }
 
-    doc.setdefault("entries", [])
+    # keep "entries" as the last key so later appends can be spliced in at the tail
+    entries = doc.pop("entries", None)
+    doc["entries"] = entries if isinstance(entries, list) else []
     doc["entries"].append(record)
 
     # Persist locally
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(doc, f, ensure_ascii=False, indent=indent)
+    data = _json_dumpb(doc, indent)
+    with open(json_path, "wb") as f:
+        f.write(data)
+    _remember_json_tail(json_path, data, indent)
 
     cprint(f"[saved] {json_path}", "cyan")
 
 
+_jsonl_header_written: set[str] = set()
+
+# LRU of open append handles keyed by .jsonl path, so a reply costs one write
+# instead of open+write+close. Evicted/leftover handles are closed.
+_JSON_FH_CACHE: "OrderedDict[str, io.BufferedWriter]" = OrderedDict()
+_JSON_FH_MAX = 32
+_JSON_LAST_FLUSH: dict[str, float] = {}  # path -> monotonic time of last flush
+_JSON_FH_LOCK = threading.RLock()         # cache + handles are shared with the flusher thread
+_json_flusher: threading.Thread | None = None
+
+def _flush_idle_jsonl_fhs(interval: float) -> None:
+    """Daemon loop: flush handles not flushed for `interval` s, so the last replies to a
+    file that goes quiet do not sit in the buffer until eviction/exit."""
+    while True:
+        time.sleep(interval)
+        now = time.monotonic()
+        with _JSON_FH_LOCK:
+            for path, fh in _JSON_FH_CACHE.items():
+                if now - _JSON_LAST_FLUSH.get(path, 0.0) >= interval:
+                    try:
+                        fh.flush()
+                    except Exception as e:
+                        cprint(f"[warn] flush {path} failed: {e}", "red")
+                    _JSON_LAST_FLUSH[path] = now
+
+def _get_jsonl_fh(path: str) -> io.BufferedWriter:
+    global _json_flusher
+    fh = _JSON_FH_CACHE.get(path)
+    if fh is not None:
+        _JSON_FH_CACHE.move_to_end(path)
+        return fh
+    if _json_flusher is None and args.json_flush_interval > 0:
+        _json_flusher = threading.Thread(target=_flush_idle_jsonl_fhs, args=(args.json_flush_interval,),
+                                         name="jsonl-flush", daemon=True)
+        _json_flusher.start()
+    fh = io.BufferedWriter(open(path, "ab", buffering=0), 1 << 16)
+    _JSON_FH_CACHE[path] = fh
+    if len(_JSON_FH_CACHE) > _JSON_FH_MAX:
+        old_path, old = _JSON_FH_CACHE.popitem(last=False)
+        _JSON_LAST_FLUSH.pop(old_path, None)
+        old.close()
+    return fh
+
+def _close_jsonl_fhs() -> None:
+    with _JSON_FH_LOCK:
+        while _JSON_FH_CACHE:
+            _, fh = _JSON_FH_CACHE.popitem(last=False)
+            try:
+                fh.close()
+            except Exception:
+                pass
+
+atexit.register(_close_jsonl_fhs)
+
+def _append_entry_to_jsonl(
+    jsonl_path: str,
+    image_path_or_url: str,
+    model,
+    prompt_text: str,
+    reply_text: str,
+):
+    """
+    Append-only variant of _append_entry_to_json: one header line per file, then one
+    {timestamp, prompt, response} line per reply. No re-read/re-serialize of earlier turns.
+    """
+    record = {
+        "timestamp": int(time.time()),
+        "prompt": prompt_text,
+        "response": reply_text,
+    }
+    with _JSON_FH_LOCK:
+        f = _get_jsonl_fh(jsonl_path)
+        if jsonl_path not in _jsonl_header_written:
+            if f.tell() == 0:
+                header = {
+                    "image_path": image_path_or_url.strip().strip("'").strip('"'),
+                    "model": getattr(model, "repo_id", None) or getattr(model, "name", None),
+                    "api": getattr(model, "api", None),
+                }
+                f.write(_json_dumpb(header) + b"\n")
+            _jsonl_header_written.add(jsonl_path)
+        f.write(_json_dumpb(record) + b"\n")
+        now = time.monotonic()
+        if now - _JSON_LAST_FLUSH.get(jsonl_path, 0.0) >= args.json_flush_interval:
+            f.flush()
+            _JSON_LAST_FLUSH[jsonl_path] = now
+
+    cprint(f"[saved] {jsonl_path}", "cyan")
+
+def load_json_by_image(path: str) -> dict:
+    """
+    Return the dict-shaped per-image document ({image_path, model, api, entries}) for
+    either storage format: a .json file as-is, or a .jsonl file rematerialized.
+    """
+    with _JSON_FH_LOCK:
+        fh = _JSON_FH_CACHE.get(path)
+        if fh is not None:
+            fh.flush()  # writer may still hold unflushed lines
+    if not path.endswith(".jsonl"):
+        with open(path, "rb") as f:
+            return _json_loadb(f.read())
+    doc = {"image_path": None, "model": None, "api": None, "entries": []}
+    with open(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = _json_loadb(line)
+            if "image_path" in obj:
+                doc.update(obj)
+            else:
+                doc["entries"].append(obj)
+    return doc
+
 # ---------------------------
 # Single "run cycle"
 # ---------------------------
 
+def _notify_done(url: str, fut) -> None:
+    status, body = fut.result()
+    if status in (200, 201):
+        cprint(f"[notify] sent caption to {url} (status {status})", "cyan")
+    else:
+        cprint(f"[notify][warn] failed to notify {url} (status {status}): {body}", "yellow")
+
+def _notify_async(text: str) -> None:
+    """Queue a text/plain POST of 'text' to --notify-url and return immediately."""
+    url = args.notify_url.strip()
+    fut = NOTIFY_POOL.submit(_http_post_text, url, text, 10.0)
+    fut.add_done_callback(lambda f: _notify_done(url, f))
+
 _run_lock = threading.Lock()
 
+_gen_count = 0
+_STATS_EVERY = max(1, args.stats_every if args.stats_every is not None else (10 if args.server else 1))
+
 def process_user_prompt(user_prompt: str, *, generate: bool = True) -> str:
     """
     Execute one cycle:
@@ -224,7 +424,7 @@ def process_user_prompt(user_prompt: str, *, generate: bool = True) -> str:
     - Optionally notify comm-manager with message-only text.
     Returns the textual reply produced by the model (or "" if generate=False).
     """
-    global last_image_path
+    global last_image_path, _gen_count
 
     # Detect image path/URL
     if _is_image_path_or_url(user_prompt):
@@ -268,28 +468,36 @@ def process_user_prompt(user_prompt: str, *, generate: bool = True) -> str:
         chat_history.append("bot", f"[error] generation failed: {e}")
         # notify error as text if needed
         if args.notify_url:
-            _http_post_text(args.notify_url.strip(), f"[error] generation failed: {e}", timeout=10.0)
+            _notify_async(f"[error] generation failed: {e}")
         return f"[error] generation failed: {e}"
 
     reply_text = ""
     if args.disable_streaming:
         # Non-streaming mode: reply is a single string
         reply_text = reply
-        cprint(reply_text, args.reply_color)
+        sys.stdout.write(_REPLY_PFX + reply_text + _REPLY_SFX + "\n")
         gen_end = time.perf_counter()
         print(f"[TICTOK] generate_total: {(gen_end - gen_start):.3f}s")
     else:
         # Streaming mode: reply yields tokens
+        # Stream raw tokens between one color prefix/reset pair and flush at most every
+        # 30 ms, instead of a termcolor wrap + flush per token.
+        write = sys.stdout.write
+        flush = sys.stdout.flush
         first_token_time = None
-        token_count = 0
+        last_flush = 0.0
+        reply_chunks = []
         for token in reply:
             now = time.perf_counter()
             if first_token_time is None:
                 first_token_time = now
                 print(f"[TICTOK] TTFT: {(first_token_time - gen_start)*1000:.2f} ms")
-            cprint(token, args.reply_color, end="", flush=True)
-            reply_text += token
-            token_count += 1
+                write(_REPLY_PFX)
+            write(token)
+            if now - last_flush > 0.03:
+                flush()
+                last_flush = now
+            reply_chunks.append(token)
             if interrupt:
                 try:
                     reply.stop()
@@ -298,7 +506,12 @@ def process_user_prompt(user_prompt: str, *, generate: bool = True) -> str:
                 interrupt.reset()
                 break
 
+        if first_token_time is not None:
+            write(_REPLY_SFX)
+            flush()
         gen_end = time.perf_counter()
+        reply_text = "".join(reply_chunks)
+        token_count = len(reply_chunks)
         total_time = gen_end - gen_start
         if token_count > 0:
             throughput = token_count / (gen_end - (first_token_time or gen_start))
@@ -306,7 +519,8 @@ def process_user_prompt(user_prompt: str, *, generate: bool = True) -> str:
 
     print("")  # newline after generation
 
-    if not args.disable_stats:
+    _gen_count += 1
+    if not args.disable_stats and _gen_count % _STATS_EVERY == 0:
         print_table(model.stats)
         print("")
 
@@ -317,27 +531,42 @@ def process_user_prompt(user_prompt: str, *, generate: bool = True) -> str:
     if args.save_json_by_image:
         if last_image_path:
             json_path = _json_path_for_image(last_image_path)
-            _append_entry_to_json(
-                json_path=json_path,
-                image_path_or_url=last_image_path,
-                model=model,
-                prompt_text=user_prompt,
-                reply_text=reply_text,
-                indent=(None if args.json_indent == 0 else args.json_indent),
-            )
+            if args.json_format == "jsonl":
+                _append_entry_to_jsonl(
+                    jsonl_path=os.path.splitext(json_path)[0] + ".jsonl",
+                    image_path_or_url=last_image_path,
+                    model=model,
+                    prompt_text=user_prompt,
+                    reply_text=reply_text,
+                )
+            else:
+                _append_entry_to_json(
+                    json_path=json_path,
+                    image_path_or_url=last_image_path,
+                    model=model,
+                    prompt_text=user_prompt,
+                    reply_text=reply_text,
+                    indent=(None if args.json_indent == 0 else args.json_indent),
+                )
         else:
             cprint("[warn] --save-json-by-image is enabled, but no image path/URL was provided yet.", "red")
 
     # ---- Notify comm-manager (message-only) ----
     if args.notify_url and reply_text.strip():
-        status, body = _http_post_text(args.notify_url.strip(), reply_text.strip(), timeout=10.0)
-        if status in (200, 201):
-            cprint(f"[notify] sent caption to {args.notify_url} (status {status})", "cyan")
-        else:
-            cprint(f"[notify][warn] failed to notify {args.notify_url} (status {status}): {body}", "yellow")
+        _notify_async(reply_text.strip())
 
     return reply_text
 
+def process_multi(prompts: list[str], *, image: str | None = None) -> list[str]:
+    """
+    Run several user turns as one conversation: append the image (if any) without
+    generating, then call process_user_prompt once per prompt, in order.
+    Returns one reply per prompt.
+    """
+    if image:
+        process_user_prompt(image, generate=False)
+    return [process_user_prompt(prompt, generate=True) for prompt in prompts]
+
 
 # ---------------------------
 # HTTP Server mode (Flask)
@@ -345,66 +574,96 @@ def process_user_prompt(user_prompt: str, *, generate: bool = True) -> str:
 
 if args.server:
     # Lazy import so Flask is only required in --server mode.
-    from flask import Flask, request, jsonify
+    from flask import Flask, Response, request
+
+    def _json_response(obj, status: int = 200) -> Response:
+        return Response(_json_dumpb(obj), status=status, mimetype="application/json")
 
     app = Flask(__name__)
 
+    def _describe_one(image_path: str, question: str) -> dict:
+        """One image → fresh conversation: auto prompt (+ optional question), under _run_lock."""
+        with _run_lock:
+            # RESET between requests
+            chat_history.reset()
+            globals()['last_image_path'] = None
+
+            # image + auto prompt (+ optional follow-up) as one conversation
+            auto_prompt = "Describe the objects in the image"
+            replies = process_multi([auto_prompt] + ([question] if question else []), image=image_path)
+        return {
+            "ok": True,
+            "image_path": image_path,
+            "auto_prompt": auto_prompt,
+            "response_describe": replies[0],
+            "response_question": replies[1] if question else None
+        }
+
     @app.route("/describe", methods=["POST"])
     def describe():
         """
         JSON in:
           {
-            "image_path": "/data/images/01.jpg",   # required
+            "image_path": "/data/images/01.jpg",   # required (or image_paths)
+            "image_paths": ["/data/images/01.jpg", ...],  # batch: one result per image
             "question": "optional follow-up"       # optional
           }
 
         Behavior:
-          - Hard reset of chat context for every request (prevents leakage).
+          - Hard reset of chat context for every image (prevents leakage).
           - Append the image (no generation).
           - Auto-inject "Describe the image" and generate.
           - If 'question' provided, ask it as a second turn and generate.
           - Local JSON-by-image saving remains intact via process_user_prompt.
           - If --notify-url is set, each generation is sent as text/plain to it.
+          - With image_paths the reply is {"ok": true, "results": [<single reply>, ...]}
+            in request order; the lock is taken per image, so single requests interleave.
+            An image that fails gets {"ok": false, "image_path": ..., "error": ...} in
+            its slot; the other images are still described.
         """
-        body = request.get_json(force=True, silent=False) or {}
-        image_path = (body.get("image_path") or "").strip()
-        question   = (body.get("question")   or "").strip()
+        # raw body + orjson (when available) instead of request.get_json
+        try:
+            body = _json_loadb(request.get_data(cache=False) or b"{}")
+        except ValueError:
+            return _json_response({"error": "invalid JSON body"}, 400)
+        if not isinstance(body, dict):
+            body = {}
+        question = (body.get("question") or "").strip()
+
+        image_paths = body.get("image_paths")
+        if image_paths is not None:
+            if not isinstance(image_paths, list) or not all(isinstance(p, str) and p.strip() for p in image_paths):
+                return _json_response({"error": "image_paths must be a list of paths"}, 400)
+            results = []
+            for p in image_paths:
+                try:
+                    results.append(_describe_one(p.strip(), question))
+                except Exception as e:
+                    cprint(f"[warn] describe failed for {p.strip()}: {e}", "red")
+                    results.append({"ok": False, "image_path": p.strip(), "error": str(e)})
+            return _json_response({"ok": True, "results": results})
 
+        image_path = (body.get("image_path") or "").strip()
         if not image_path:
-            return jsonify({"error": "image_path is required"}), 400
-
-        with _run_lock:
-            # RESET between requests
-            chat_history.reset()
-            globals()['last_image_path'] = None
+            return _json_response({"error": "image_path is required"}, 400)
 
-            # 1) add the image to history (no generation)
-            process_user_prompt(image_path, generate=False)
-
-            # 2) auto prompt
-            auto_prompt = "Describe the objects in the image"
-            resp_describe = process_user_prompt(auto_prompt, generate=True)
-
-            # 3) optional follow-up
-            resp_question = None
-            if question:
-                resp_question = process_user_prompt(question, generate=True)
-
-        return jsonify({
-            "ok": True,
-            "image_path": image_path,
-            "auto_prompt": auto_prompt,
-            "response_describe": resp_describe,
-            "response_question": resp_question
-        })
+        return _json_response(_describe_one(image_path, question))
 
     @app.get("/health")
     def health():
         """Simple health endpoint to verify server is up."""
-        return jsonify({"ok": True, "time": int(time.time())})
+        return _json_response({"ok": True, "time": int(time.time())})
 
-    # Start the server and exit the CLI flow
-    app.run(host="0.0.0.0", port=args.port)
+    # Start the server and exit the CLI flow.
+    # waitress if installed (threaded production WSGI), else the threaded Werkzeug server.
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+    if serve is not None:
+        serve(app, host="0.0.0.0", port=args.port, threads=max(1, args.server_threads))
+    else:
+        app.run(host="0.0.0.0", port=args.port, threaded=True)
     sys.exit(0)
 
 
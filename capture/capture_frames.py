@@ -14,12 +14,32 @@ except Exception:
 from gpio_helper import gpio_interactive
 from manual_and_timer_capture import timer_capture, manual_interactive
 from handle_folder_reading import loop_over_folder, interactive_from_folder
+from vlm_helper import close_vlm_client
+from txt_and_image_utils import (open_full_pack, close_full_pack, open_capture_log, close_capture_log,
+                                 enable_hw_jpeg)
+
+# GStreamer fallback for /dev/video*. io-mode=2 lets v4l2src hand out the driver's
+# mmap'd buffers without a copy; the leaky single-slot queue and appsink drop=true
+# max-buffers=1 then throw stale frames away, so a sporadic read (timer/GPIO modes)
+# gets the newest frame instead of one that waited in the pipeline.
+_GST_TAIL = ("! queue leaky=downstream max-size-buffers=1 max-size-bytes=0 max-size-time=0 "
+             "! appsink drop=true max-buffers=1 sync=false emit-signals=false")
+_GST_MJPG_TMPL = ("v4l2src device={device} io-mode=2 do-timestamp=true "
+                  "! image/jpeg,framerate={fps}/1 "
+                  "! jpegdec ! videoconvert ! video/x-raw,format=BGR " + _GST_TAIL)
+_GST_YUY2_TMPL = ("v4l2src device={device} io-mode=2 do-timestamp=true "
+                  "! video/x-raw,format=YUY2,framerate={fps}/1 "
+                  "! videoconvert ! video/x-raw,format=BGR " + _GST_TAIL)
+
+def _min_buffering(cap):
+    # keep at most one queued frame on every backend (unsupported ones just ignore it)
+    try: cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    except Exception: pass
+    return cap
 
 def open_capture(src: str, width=None, height=None, fps=None, fourcc=None):
     if "://" in src:
-        cap = cv2.VideoCapture(src, cv2.CAP_FFMPEG)
-        try: cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-        except Exception: pass
+        cap = _min_buffering(cv2.VideoCapture(src, cv2.CAP_FFMPEG))
         if not cap.isOpened():
             raise RuntimeError(f"failed to open network/file source: {src}")
         return cap
@@ -32,33 +52,23 @@ def open_capture(src: str, width=None, height=None, fps=None, fourcc=None):
             if width:  cap.set(cv2.CAP_PROP_FRAME_WIDTH,  int(width))
             if height: cap.set(cv2.CAP_PROP_FRAME_HEIGHT, int(height))
             if fps:    cap.set(cv2.CAP_PROP_FPS,          float(fps))
-            try: cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            except Exception: pass
+            _min_buffering(cap)
             ok,_ = cap.read()
             if ok: return cap
             cap.release()
 
         # fallback GStreamer
-        gst = (
-            f"v4l2src device={src} io-mode=2 do-timestamp=true ! "
-            f"image/jpeg,framerate={int(fps) if fps else 30}/1 "
-            f"! jpegdec ! videoconvert ! video/x-raw,format=BGR "
-            f"! appsink drop=true max-buffers=1 sync=false"
-            if (fourcc or "MJPG") == "MJPG" else
-            f"v4l2src device={src} io-mode=2 do-timestamp=true ! "
-            f"video/x-raw,format=YUY2,framerate={int(fps) if fps else 30}/1 "
-            f"! videoconvert ! video/x-raw,format=BGR "
-            f"! appsink drop=true max-buffers=1 sync=false"
-        )
+        tmpl = _GST_MJPG_TMPL if (fourcc or "MJPG") == "MJPG" else _GST_YUY2_TMPL
+        gst = tmpl.format(device=src, fps=int(fps) if fps else 30)
         cap = cv2.VideoCapture(gst, cv2.CAP_GSTREAMER)
         if cap.isOpened():
-            return cap
+            return _min_buffering(cap)
         raise RuntimeError(f"failed to open V4L2 source: {src}")
 
     cap = cv2.VideoCapture(src)
     if not cap.isOpened():
         raise RuntimeError(f"failed to open source: {src}")
-    return cap
+    return _min_buffering(cap)
 
 def main():
     ap = argparse.ArgumentParser()
@@ -76,8 +86,15 @@ def main():
                     help="Center-crop fraction for captured image (1.0=no crop).")
     ap.add_argument("--save-full", action="store_true",
                     help="Also save the full uncropped frame as *_full.jpg for debugging.")
+    ap.add_argument("--pack", action="store_true",
+                    help="With --save-full, append the full frames to <out>/frames.pack (+ frames.idx) instead of one *_full.jpg each.")
+    ap.add_argument("--captures-log", action="store_true",
+                    help="Append pose/caption records to <out>/captures.jsonl and write the per-image "
+                         "*.json sidecars once at exit (they are not visible to the display server until then).")
     ap.add_argument("--flip-180", action="store_true",
                     help="Rotate the (cropped) image by 180° before saving.")
+    ap.add_argument("--hw-jpeg", action="store_true",
+                    help="Encode JPEGs with the Jetson hardware encoder (nvjpegenc via GStreamer); CPU fallback.")
 
     # Read from directory options
     ap.add_argument("--frames-dir", default="", help="If set, operate on images from this folder instead of camera")
@@ -114,7 +131,14 @@ def main():
     # VLM options
     ap.add_argument("--vlm", default="", help="VLM describe endpoint, e.g. http://172.16.17.12:8080/describe (empty to disable)")
     ap.add_argument("--vlm-timeout", type=float, default=30.0)
-    ap.add_argument("--vlm-retries", type=int, default=2)
+    ap.add_argument("--vlm-retries", type=int, default=2,
+                    help="Attempts per describe POST. Only connect errors and 502/503/504 replies are "
+                         "retried (with backoff); read timeouts and other errors are not, since the "
+                         "server may already be captioning the image")
+    ap.add_argument("--vlm-batch", type=int, default=4,
+                    help="Max images per describe request (1 = one request per image)")
+    ap.add_argument("--vlm-batch-wait", type=float, default=0.05,
+                    help="Seconds to wait for more captures before sending a partial batch")
     ap.add_argument("--vlm-path-src", default="", help="local root to strip (for path remap), optional")
     ap.add_argument("--vlm-path-dst", default="", help="remote root to prepend (for path remap), optional")
 
@@ -124,6 +148,13 @@ def main():
     args.out = os.path.join(args.out, out_dir)
     os.makedirs(args.out, exist_ok=True)
 
+    if args.hw_jpeg:
+        enable_hw_jpeg()
+    if args.pack and args.save_full:
+        open_full_pack(args.out)
+    if args.captures_log:
+        open_capture_log(args.out)
+
     cap = open_capture(args.source, args.width, args.height, args.fps, args.fourcc)
 
     # warmup
@@ -132,20 +163,26 @@ def main():
 
     # --- interactive mode: capture-by-key, pose advances from poses.json ---
     # --- mode dispatch ---
-    if args.gpio_pin is not None:
-        gpio_interactive(args, cap=cap)
-    elif args.interactive:
-        if args.frames_dir:
-            interactive_from_folder(args)  # keyboard + folder
-        else:
-            manual_interactive(args, cap=cap)  # keyboard + camera
-    else:
-        if args.frames_dir:
-            loop_over_folder(args)  # timed loop over folder
+    try:
+        if args.gpio_pin is not None:
+            gpio_interactive(args, cap=cap)
+        elif args.interactive:
+            if args.frames_dir:
+                interactive_from_folder(args)  # keyboard + folder
+            else:
+                manual_interactive(args, cap=cap)  # keyboard + camera
         else:
-            timer_capture(args, cap=cap)  # timed poses from camera
-
-    cap.release()
+            if args.frames_dir:
+                loop_over_folder(args)  # timed loop over folder
+            else:
+                timer_capture(args, cap=cap)  # timed poses from camera
+    finally:
+        cap.release()
+        close_vlm_client()  # pending captions land in the sidecars / captures.jsonl first
+        close_full_pack()
+        n = close_capture_log()
+        if n:
+            print(f"[capture] wrote {n} sidecars from captures.jsonl")
     print("[capture] done.")
 
 
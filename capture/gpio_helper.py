@@ -1,8 +1,9 @@
-import os, json, time, argparse, cv2
+import os, json, argparse, cv2, queue, threading
 import Jetson.GPIO as GPIO
 
-from txt_and_image_utils import _update_sidecar_json, _apply_crop_and_flip, pose_to_name, _save_jpg, _unique_name
-from vlm_helper import prep_vlm
+from txt_and_image_utils import (_update_sidecar_json, _apply_crop_and_flip, pose_to_name, _save_full, _unique_name,
+                                 _encode_jpg, _write_bytes, _scratch_like, _to_bgr, LatestFrameGrabber)
+from vlm_helper import get_vlm_client, close_vlm_client
 
 def init_gpio(args):
     # 1) Select numbering scheme
@@ -18,6 +19,73 @@ def init_gpio(args):
     GPIO.setup(args.gpio_pin, GPIO.IN)
     GPIO.setup(args.gpio_first_frame, GPIO.IN)
 
+# Saves, sidecar writes and the VLM round-trip run on one background worker so the
+# GPIO loop only grabs/crops frames and never misses an edge while a capture is written.
+SAVE_Q = queue.Queue(maxsize=8)
+
+# VLM describe calls go through the shared batching VLMClient, so a slow VLM never
+# holds up the next save; a full client backlog skips the call instead of blocking.
+def _submit_vlm(args, jpg_path, pose, json_path) -> bool:
+    """Queue the describe (the client writes the sidecar); False if the VLM backlog is full."""
+    if get_vlm_client(args).submit(jpg_path, pose, json_path, block=False):
+        return True
+    print(f"[vlm] WARN: describe backlog full, skipping {jpg_path}")
+    return False
+
+# Rotated crops / gray→BGR conversions are written into rings of preallocated buffers
+# instead of a fresh array per capture. A buffer is reused only after every frame that
+# could still be queued or being written (SAVE_Q.maxsize + writer + the one being built)
+# has moved on.
+_FLIP_RING_SIZE = SAVE_Q.maxsize + 2
+
+def _next_flip_buf(full_frame, crop_frac):
+    H, W = full_frame.shape[:2]
+    if crop_frac < 1.0:
+        frac = max(0.05, min(1.0, float(crop_frac)))  # same clamp as center_crop_frac
+        H, W = int(H * frac), int(W * frac)
+    return _scratch_like((H, W) + full_frame.shape[2:], full_frame.dtype, "gpio-flip", _FLIP_RING_SIZE)
+
+def _write_capture(args, jpg_path, json_path, frame, full_frame, pose, label):
+    # encode once; with no crop/flip the full image is the same frame, so reuse the bytes
+    try:
+        jpg = _encode_jpg(frame)
+    except Exception as e:
+        print(f"[capture] ERROR: {e}")
+        return
+
+    # optional save of original
+    if full_frame is not None:
+        try:
+            _save_full(jpg_path, full_frame, data=jpg if full_frame is frame else None, pose=pose)
+        except Exception as e:
+            print(f"[capture] WARN: save *_full.jpg failed: {e}")
+
+    # save working image
+    try:
+        _write_bytes(jpg_path, jpg)
+    except Exception as e:
+        print(f"[capture] ERROR: failed to write {jpg_path}: {e}")
+        return
+
+    # optional VLM call (async); the client writes the sidecar once the caption is in,
+    # so the pose-only sidecar is written here only when no VLM call was queued
+    if not (args.vlm and _submit_vlm(args, jpg_path, pose, json_path)):
+        _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=None)
+
+    print(f"[capture] GPIO-triggered save → {jpg_path}  ({label})")
+
+def _writer_worker(args):
+    while True:
+        job = SAVE_Q.get()
+        try:
+            if job is None:
+                return
+            _write_capture(args, *job)
+        except Exception as e:
+            print(f"[capture] ERROR: background save failed: {e}")
+        finally:
+            SAVE_Q.task_done()
+
 def gpio_interactive(args, cap: cv2.VideoCapture):
     """
     Step through poses.json. Each GPIO edge triggers the next capture.
@@ -39,105 +107,90 @@ def gpio_interactive(args, cap: cv2.VideoCapture):
     debounce = max(0, int(args.gpio_debounce_ms))
 
     print(f"[gpio] listening on {args.pin_mode} {args.gpio_pin} (edge={args.gpio_edge})")
-    # Use software debounce by tracking last transition time
+    # Edges are detected (and debounced) by the GPIO driver; the callback only queues them,
+    # so an edge arriving while a capture is being handled is never lost.
+    edges = queue.SimpleQueue()
+    edge = {"rising": GPIO.RISING, "falling": GPIO.FALLING}.get(args.gpio_edge, GPIO.BOTH)
+    GPIO.add_event_detect(args.gpio_pin, edge, bouncetime=debounce or None)
+    GPIO.add_event_callback(args.gpio_pin, lambda channel: edges.put(channel))
+
     idx = 0
-    last_ms = 0
     counter = 1
-    prev = None
+    out_prefix = os.path.join(args.out, "")   # "<out>/": names are joined by concatenation
     is_initialized = False
+    writer = threading.Thread(target=_writer_worker, args=(args,), name="capture-writer", daemon=True)
+    writer.start()
+    grabber = LatestFrameGrabber(cap, decode=False)   # edges are sparse: decode only the frame taken
+    grabber.start()
     try:
         while True:
-            # Grab a fresh frame so we’re ready when an edge comes
-            ok, frame = False, None
-            for _ in range(args.retry):
-                ok, frame = cap.read()
-                if ok and frame is not None:
-                    break
-                time.sleep(0.01)
+            edges.get()
+
+            # if not is_initialized:
+            #     if GPIO.input(args.gpio_first_frame) == GPIO.HIGH:
+            #         idx = 0
+            #         is_initialized = True
+            #     else:
+            #         continue
+
+            if idx >= len(poses):
+                print("[gpio] all poses captured. exiting.")
+                break
+
+            ok, frame = grabber.get()
             if not ok or frame is None:
-                time.sleep(0.01)
+                print("[capture] WARN: no frame for GPIO edge, skipping")
                 continue
 
-            val = GPIO.input(args.gpio_pin)
-            first_frame_val = GPIO.input(args.gpio_first_frame)
-
-            if val != prev:
-                # if not is_initialized:
-                #     if first_frame_val == GPIO.HIGH:
-                #         idx = 0
-                #         is_initialized = True
-                #     else:
-                #         continue
-
-                prev = val
-                if val == GPIO.HIGH:  # rising
-                    now = int(time.time() * 1000)
-                    if now - last_ms < debounce:
-                        continue
-                    last_ms = now
-
-                    if idx >= len(poses):
-                        print("[gpio] all poses captured. exiting.")
-                        break
-
-                    # if idx >= len(poses):
-                    #     idx = min(idx, len(poses) - 1)
-                    # else:
-                    #     if idx >= len(poses):
-                    #         print("[gpio] all poses captured. exiting.")
-                    #         break
-
-                    pose = poses[idx]
-                    # If you want sequential fallback when no index pins:
-                    idx += 1
-
-                    # ensure color
-                    if len(frame.shape) == 2:
-                        frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-
-                    # center-crop if requested
-                    full_frame = frame
-                    try:
-                        frame, crop_box = _apply_crop_and_flip(full_frame, args.crop_frac, args.flip_180)
-                    except Exception as e:
-                        print(f"[capture] WARN: crop/flip failed ({e}). Using full frame.")
-                        frame, crop_box = full_frame, None
-
-                    # build filepaths
-                    base_stem = pose_to_name(pose)
-                    base_path = os.path.join(args.out, base_stem)
-                    jpg_path, json_path = (base_path + ".jpg", base_path + ".json")
-                    if args.suffix:
-                        jpg_path, json_path = _unique_name(base_path, True, counter)
-                        counter += 1
-
-                    # optional save of original
-                    if getattr(args, "save_full", False):
-                        try:
-                            _save_jpg(jpg_path.replace(".jpg", "_full.jpg"), full_frame)
-                        except Exception as e:
-                            print(f"[capture] WARN: save *_full.jpg failed: {e}")
-
-                    # save working image
-                    try:
-                        _save_jpg(jpg_path, frame)
-                    except Exception as e:
-                        print(f"[capture] ERROR: {e}")
-                        continue
-
-                    # sidecar (pose + image)
-                    _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=None)
-
-                    # optional VLM call (unchanged)
-                    if args.vlm:
-                        prep_vlm(args, jpg_path, pose, json_path)
-
-                    print(f"[capture] GPIO-triggered save → {jpg_path}  ({idx}/{len(poses)})")
-
-            # light idle
-            time.sleep(0.2)
+            # if idx >= len(poses):
+            #     idx = min(idx, len(poses) - 1)
+            # else:
+            #     if idx >= len(poses):
+            #         print("[gpio] all poses captured. exiting.")
+            #         break
+
+            pose = poses[idx]
+            # If you want sequential fallback when no index pins:
+            idx += 1
+
+            # ensure color
+            frame = _to_bgr(frame, "gpio-bgr", _FLIP_RING_SIZE)
+
+            # center-crop if requested
+            full_frame = frame
+            try:
+                dst = _next_flip_buf(full_frame, args.crop_frac) if args.flip_180 else None
+                frame, crop_box = _apply_crop_and_flip(full_frame, args.crop_frac, args.flip_180, dst=dst)
+            except Exception as e:
+                print(f"[capture] WARN: crop/flip failed ({e}). Using full frame.")
+                frame, crop_box = full_frame, None
+
+            # build filepaths
+            base_stem = pose_to_name(pose)
+            base_path = out_prefix + base_stem
+            jpg_path, json_path = (base_path + ".jpg", base_path + ".json")
+            if args.suffix:
+                jpg_path, json_path = _unique_name(base_path, True, counter)
+                counter += 1
+
+            try:
+                SAVE_Q.put_nowait((
+                    jpg_path, json_path, frame,
+                    full_frame if getattr(args, "save_full", False) else None,
+                    pose, f"{idx}/{len(poses)}",
+                ))
+            except queue.Full:
+                print(f"[capture] WARN: save queue full, dropping {jpg_path}")
 
     finally:
+        grabber.stop()
+        SAVE_Q.put(None)  # let queued captures finish before exiting
+        writer.join()
+        close_vlm_client()
+        try:
+            GPIO.remove_event_detect(args.gpio_pin)
+        except Exception:
+            pass
         try:
             GPIO.cleanup()
         except Exception:
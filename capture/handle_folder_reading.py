@@ -1,10 +1,97 @@
-import os, time, cv2
-from txt_and_image_utils import  (list_frames, get_pose_for_frame,
-                                  _save_jpg, _update_sidecar_json,
-                                  pose_to_name, _unique_name,
-                                  load_angles_map)
+import os, time, cv2, mmap, queue, threading
+import numpy as np
+from collections import OrderedDict
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from txt_and_image_utils import  (list_frames, frame_poses,
+                                  pose_xyz_to_name, _unique_name,
+                                  load_angles_map, _save_capture_async, _drain_pending)
 
-from vlm_helper import prep_vlm
+from vlm_helper import get_vlm_client
+
+class _MmapCache:
+    """
+    LRU of read-only mmaps of source frames, keyed by path and invalidated by (mtime, size).
+    Repeat passes over a folder decode straight from the page cache without open+read.
+    """
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self._maps = OrderedDict()   # path -> (mtime_ns, size, mmap)
+
+    def _close(self, entry):
+        try:
+            entry[2].close()
+        except Exception:
+            pass
+
+    def imread(self, path: str, flags=cv2.IMREAD_COLOR):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        entry = self._maps.get(path)
+        if entry is not None and entry[:2] != (st.st_mtime_ns, st.st_size):
+            self._close(self._maps.pop(path))
+            entry = None
+        if entry is None:
+            if st.st_size == 0:
+                return cv2.imread(path, flags)
+            try:
+                with open(path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return cv2.imread(path, flags)
+            entry = self._maps[path] = (st.st_mtime_ns, st.st_size, mm)
+            if len(self._maps) > self.maxsize:
+                self._close(self._maps.popitem(last=False)[1])
+        else:
+            self._maps.move_to_end(path)
+        buf = np.frombuffer(entry[2], np.uint8)
+        try:
+            return cv2.imdecode(buf, flags)
+        finally:
+            del buf   # release the export so the mmap can be closed on eviction
+
+    def close(self):
+        while self._maps:
+            self._close(self._maps.popitem(last=False)[1])
+
+_frames_mm = _MmapCache()
+_DECODER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame-decode")  # one thread: _MmapCache isn't locked
+
+class FramePrefetcher(threading.Thread):
+    """
+    Decodes frame i+1 while the loop handles frame i. Yields (path, img) in loop order
+    (img None if unreadable); ends with None after one pass unless 'loop' is set.
+    """
+    def __init__(self, frames, loop: bool, depth: int = 2):
+        super().__init__(name="frame-prefetch", daemon=True)
+        self.frames = frames
+        self.loop = loop
+        self.q = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self.q.put(item, timeout=0.2)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self):
+        while True:
+            for path in self.frames:
+                if not self._put((path, _frames_mm.imread(path, cv2.IMREAD_COLOR))):
+                    return
+            if not self.loop:
+                self._put(None)
+                return
+
+    def stop(self):
+        self._stop.set()
+        self.join(timeout=1.0)
 
 def interactive_from_folder(args):
     frames = list_frames(args.frames_dir)
@@ -13,9 +100,18 @@ def interactive_from_folder(args):
         return
     angles_map = load_angles_map(args.angles_json) if args.angles_json else {}
     idx, counter = 0, 1
+    vlm = get_vlm_client(args) if args.vlm else None
     if args.preview:
         cv2.namedWindow("preview", cv2.WINDOW_NORMAL)
 
+    _basename, out_prefix = os.path.basename, os.path.join(args.out, "")
+    imread, save_full = _frames_mm.imread, args.save_full
+    poses = frame_poses(frames, angles_map=angles_map, from_name=args.angles_from_name)
+
+    # Decode only when the index changes (the key loop spins at waitKey(1) rate), and
+    # decode the following frame on _DECODER while this one is on screen.
+    shown, ahead = -1, None   # ahead: (frame index, Future of its decode)
+
     print("[interactive/folder] SPACE/'c' capture • 'n' next • 'p' prev • 'q' quit")
     while True:
         if idx < 0: idx = 0
@@ -25,41 +121,45 @@ def interactive_from_folder(args):
                 print("[interactive/folder] reached end.")
                 break
 
-        path = frames[idx]
-        img = cv2.imread(path, cv2.IMREAD_COLOR)
-        if img is None:
-            print(f"[interactive/folder] WARN unreadable: {path}")
-            idx += 1; continue
+        if idx != shown:
+            path = frames[idx]
+            fut = ahead[1] if ahead is not None and ahead[0] == idx else _DECODER.submit(imread, path, cv2.IMREAD_COLOR)
+            img = fut.result()
+            shown = idx
+            nxt = idx + 1 if idx + 1 < len(frames) else (0 if args.loop_frames else None)
+            ahead = (nxt, _DECODER.submit(imread, frames[nxt], cv2.IMREAD_COLOR)) if nxt is not None else None
+            if img is None:
+                print(f"[interactive/folder] WARN unreadable: {path}")
+                idx += 1; continue
 
-        pose = get_pose_for_frame(path, angles_map=angles_map, from_name=args.angles_from_name)
-        work = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if len(img.shape)==2 else img
+            pose = poses[path]
+            work = img  # IMREAD_COLOR always decodes to 3-channel BGR
 
-        if args.preview:
-            cv2.imshow("preview", work)
+            if args.preview:
+                cv2.imshow("preview", work)
 
         key = cv2.waitKey(1) & 0xFF  # still works headless if you export offscreen vars
         if key in (ord('q'), 27): break
         if key == ord('n'): idx += 1; continue
         if key == ord('p'): idx -= 1; continue
         if key in (ord('c'), ord('C'), 32):
-            base = os.path.join(args.out, pose_to_name(pose))
+            base = out_prefix + pose_xyz_to_name(pose["x"], pose["y"], pose["z"], pose["yaw"])
             jpg_path, json_path = (base + ".jpg", base + ".json")
             if args.suffix:
                 jpg_path, json_path = _unique_name(base, True, counter); counter += 1
-            if args.save_full:
-                try:
-                    _save_jpg(jpg_path.replace(".jpg","_full.jpg"), img)
-                except Exception as e: print(f"[capture] WARN saving full: {e}")
-            try:
-                _save_jpg(jpg_path, work)
-                _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=None)
-                print(f"[capture] saved {jpg_path}  (src={os.path.basename(path)})")
-            except Exception as e:
-                print(f"[capture] ERROR: {e}")
-            if args.vlm:
-                prep_vlm(args, jpg_path, pose, json_path)
+            _save_capture_async(
+                jpg_path, work, json_path, pose,
+                full_frame=img if save_full else None,
+                done_msg=f"[capture] saved {jpg_path}  (src={_basename(path)})",
+                then=partial(vlm.submit, jpg_path, pose, json_path) if vlm else None,
+                sidecar=vlm is None,
+            )
             idx += 1
 
+    if ahead is not None:
+        ahead[1].result()  # the mmap cache is only touched from _DECODER; let it finish first
+    _drain_pending()
+    _frames_mm.close()
     if args.preview:
         cv2.destroyAllWindows()
 
@@ -69,33 +169,37 @@ def loop_over_folder(args):
         print(f"[loop] no images under {args.frames_dir}")
         return
     angles_map = load_angles_map(args.angles_json) if args.angles_json else {}
-    idx, counter = 0, 1
+    counter = 1
     print(f"[loop] iterating {len(frames)} frames, sleep={args.loop_sleep}s")
+    _basename, out_prefix = os.path.basename, os.path.join(args.out, "")
+    save_async, save_full, suffix = _save_capture_async, args.save_full, args.suffix
+    poses = frame_poses(frames, angles_map=angles_map, from_name=args.angles_from_name)
+    vlm, sleep_s = (get_vlm_client(args) if args.vlm else None), max(0.0, args.loop_sleep)
+    prefetch = FramePrefetcher(frames, loop=args.loop_frames)
+    prefetch.start()
     while True:
-        path = frames[idx]
-        img = cv2.imread(path, cv2.IMREAD_COLOR)
+        item = prefetch.q.get()
+        if item is None:
+            break
+        path, img = item
         if img is None:
             print(f"[loop] WARN unreadable: {path}")
         else:
-            pose = get_pose_for_frame(path, angles_map=angles_map, from_name=args.angles_from_name)
-            work = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if len(img.shape)==2 else img
-            base = os.path.join(args.out, pose_to_name(pose))
+            pose = poses[path]
+            work = img  # IMREAD_COLOR always decodes to 3-channel BGR
+            base = out_prefix + pose_xyz_to_name(pose["x"], pose["y"], pose["z"], pose["yaw"])
             jpg_path, json_path = (base + ".jpg", base + ".json")
-            if args.suffix:
+            if suffix:
                 jpg_path, json_path = _unique_name(base, True, counter); counter += 1
-            try:
-                if args.save_full:
-                    try: _save_jpg(jpg_path.replace(".jpg","_full.jpg"), img)
-                    except Exception as e: print(f"[loop] WARN saving full: {e}")
-                _save_jpg(jpg_path, work)
-                _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=None)
-                print(f"[loop] saved {jpg_path} (src={os.path.basename(path)})")
-            except Exception as e:
-                print(f"[loop] ERROR: {e}")
-
-            if args.vlm:
-                prep_vlm(args, jpg_path, pose, json_path)
-        time.sleep(max(0.0, args.loop_sleep))
-        idx = (idx + 1) % len(frames)
-        if not args.loop_frames and idx == 0:
-            break
\ No newline at end of file
+            save_async(
+                jpg_path, work, json_path, pose,
+                full_frame=img if save_full else None,
+                done_msg=f"[loop] saved {jpg_path} (src={_basename(path)})",
+                tag="[loop]",
+                then=partial(vlm.submit, jpg_path, pose, json_path) if vlm else None,
+                sidecar=vlm is None,
+            )
+        time.sleep(sleep_s)
+    prefetch.stop()
+    _drain_pending("[loop]")
+    _frames_mm.close()
\ No newline at end of file
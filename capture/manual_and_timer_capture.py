@@ -1,26 +1,37 @@
 import os, json, time, argparse, cv2
-from txt_and_image_utils import (_update_sidecar_json, _apply_crop_and_flip,
-                                 pose_to_name, _save_jpg, _unique_name)
-from vlm_helper import prep_vlm
+from functools import partial
+from txt_and_image_utils import (_apply_crop_and_flip, pose_to_name, _unique_name, LatestFrameGrabber,
+                                 _save_capture_async, _drain_pending, _to_bgr)
+from vlm_helper import get_vlm_client
 from contextlib import nullcontext
-import sys, termios, tty, select
+import sys, termios, tty
 
 class HeadlessKeys:
-    """Non-blocking single-char reader from stdin (no OpenCV window needed)."""
+    """
+    Single-char reader from stdin (no OpenCV window needed). read() waits in the tty
+    driver for at most wait_ds deciseconds (VTIME) and returns at once on a key press;
+    wait_ds=0 makes it fully non-blocking.
+    """
+    def __init__(self, wait_ds: int = 0):
+        self.wait_ds = max(0, min(255, int(wait_ds)))
     def __enter__(self):
         self.fd = sys.stdin.fileno()
         self.old = termios.tcgetattr(self.fd)
         tty.setcbreak(self.fd)               # raw-ish mode
+        # VMIN=0/VTIME=n: read() returns on the first key or after n/10 s, empty on timeout
+        new = termios.tcgetattr(self.fd)
+        new[6][termios.VMIN] = 0
+        new[6][termios.VTIME] = self.wait_ds
+        termios.tcsetattr(self.fd, termios.TCSANOW, new)
         return self
     def __exit__(self, *exc):
         termios.tcsetattr(self.fd, termios.TCSADRAIN, self.old)
-    def getch(self, timeout_ms=1):
+    def getch(self):
         # returns a single lowercased char like 'c','q' or None if no input
-        r, _, _ = select.select([sys.stdin], [], [], timeout_ms/1000.0)
-        if r:
-            ch = sys.stdin.read(1)
-            return ch.lower()
-        return None
+        # (one read; the wait is the VTIME set on entry via wait_ds)
+        b = os.read(self.fd, 1)
+        return b.decode(errors="ignore").lower() or None
+
 def manual_interactive(args, cap: cv2.VideoCapture):
     # load the ordered list of poses that we’ll step through
     if not os.path.isfile(args.poses):
@@ -29,6 +40,8 @@ def manual_interactive(args, cap: cv2.VideoCapture):
         poses = json.load(f)
     if not isinstance(poses, list) or not poses:
         raise ValueError("poses.json must be a non-empty list of {x,y,z,yaw}")
+    vlm = get_vlm_client(args) if args.vlm else None
+    out_prefix = os.path.join(args.out, "")   # "<out>/": names are joined by concatenation
 
     print("[interactive] preview on. Press SPACE or 'c' to capture next pose, 'q' to quit.")
     if args.preview:
@@ -37,31 +50,25 @@ def manual_interactive(args, cap: cv2.VideoCapture):
     idx = 0
     counter = 1  # used only when --suffix is set
     json_path = None
-    # Use HeadlessKeys when preview is off, else keep cv2.waitKey
-    with (HeadlessKeys() if not args.preview else nullcontext()):
+    grabber = LatestFrameGrabber(cap)
+    grabber.start()
+    # Use HeadlessKeys when preview is off, else keep cv2.waitKey.
+    # Headless, the loop sleeps in the tty read until a key arrives (0.5 s cap) and only
+    # takes a frame when capturing; with preview it is paced by new camera frames.
+    with (HeadlessKeys(wait_ds=5) if not args.preview else nullcontext()) as kb:
         while True:
-            for _ in range(3):
-                cap.grab()
-                time.sleep(0.01)
-
-            for _ in range(3):
-                cap.grab()
-                time.sleep(0.01)
-
-            ok, frame = False, None
-            for _ in range(args.retry):
-                ok, frame = cap.read()
-                if ok and frame is not None:
-                    break
-                time.sleep(0.01)
-
             # show or not
             if args.preview:
+                ok, frame = grabber.get(fresh=True)
+                if not ok or frame is None:
+                    continue
                 cv2.imshow("preview", frame)
                 key = cv2.waitKey(1) & 0xFF
                 key = chr(key).lower() if key != 255 else None
             else:
-                key = HeadlessKeys().getch(1)  # 1ms poll (we're inside context)
+                key = kb.getch()
+                if key is None:
+                    continue
 
             # handle quit
             if key in ('q', '\x1b'):  # q or ESC
@@ -73,20 +80,24 @@ def manual_interactive(args, cap: cv2.VideoCapture):
                 if idx >= len(poses):
                     print("[interactive] all poses captured. exiting.")
                     break
+                if not args.preview:
+                    ok, frame = grabber.get()
+                    if not ok or frame is None:
+                        print("[capture] WARN: no camera frame yet, press again")
+                        continue
 
                 pose = poses[idx]
                 idx += 1
 
                 base_stem = pose_to_name(pose)
-                base_path = os.path.join(args.out, base_stem)
+                base_path = out_prefix + base_stem
                 jpg_path, json_path = (base_path + ".jpg", base_path + ".json")
                 if args.suffix:
                     jpg_path, json_path = _unique_name(base_path, True, counter)
                     counter += 1
 
                 # ensure BGR
-                if len(frame.shape) == 2:
-                    frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+                frame = _to_bgr(frame)
 
                 # center-crop if requested (this becomes the image used everywhere)
                 full_frame = frame
@@ -97,30 +108,17 @@ def manual_interactive(args, cap: cv2.VideoCapture):
                     print(f"[capture] WARN: crop/flip failed ({e}). Using full frame.")
                     frame, crop_box = full_frame, None
 
-                # optional save of original
-                if getattr(args, "save_full", False):
-                    try:
-                        _save_jpg(jpg_path.replace(".jpg", "_full.jpg"), full_frame)
-                    except Exception as e:
-                        print(f"[capture] WARN: save *_full.jpg failed: {e}")
-
-                # save cropped (or full) frame
-                try:
-                    _save_jpg(jpg_path, frame)
-                except Exception as e:
-                    print(f"[capture] ERROR: {e}")
-                    continue
-
-                # sidecar (pose + image name)
-                _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=None)
-
-                # optional VLM call (unchanged from your code)
-                vlm_caption = None
-                if args.vlm:
-                    prep_vlm(args, jpg_path, pose, json_path)
-
-                print(f"[capture] saved {jpg_path}  ({idx}/{len(poses)})")
-
+                # save (+ optional original), sidecar and optional VLM call in the background
+                _save_capture_async(
+                    jpg_path, frame, json_path, pose,
+                    full_frame=full_frame if getattr(args, "save_full", False) else None,
+                    done_msg=f"[capture] saved {jpg_path}  ({idx}/{len(poses)})",
+                    then=partial(vlm.submit, jpg_path, pose, json_path) if vlm else None,
+                    sidecar=vlm is None,
+                )
+
+    grabber.stop()
+    _drain_pending()
     if args.preview:
         cv2.destroyAllWindows()
 
@@ -132,30 +130,32 @@ def timer_capture(args, cap: cv2.VideoCapture):
     if not isinstance(poses, list) or not poses:
         raise ValueError("poses.json must be a non-empty list of {x,y,z,yaw}")
 
+    grabber = LatestFrameGrabber(cap)
+    grabber.start()
+    try:
+        _timer_loop(args, poses, grabber)
+    finally:
+        grabber.stop()
+        _drain_pending()
+
+def _timer_loop(args, poses, grabber: LatestFrameGrabber):
+    vlm = get_vlm_client(args) if args.vlm else None
+    out_prefix = os.path.join(args.out, "")
     for i, pose in enumerate(poses, 1):
         fname = pose_to_name(pose)
-        jpg_path = os.path.join(args.out, f"{fname}.jpg")
-        json_path = os.path.join(args.out, f"{fname}.json")
+        base_path = out_prefix + fname
+        jpg_path, json_path = base_path + ".jpg", base_path + ".json"
 
         print(f"[capture] {i}/{len(poses)} → {jpg_path}")
         time.sleep(args.sleep)
-        for _ in range(3):
-            cap.grab()
-            time.sleep(0.01)
-
-        ok, frame = False, None
-        for _ in range(args.retry):
-            ok, frame = cap.read()
-            if ok and frame is not None:
-                break
-            time.sleep(0.01)
+        ok, frame = grabber.get()
         if not ok or frame is None:
             print(f"[capture] WARN: failed to read frame for pose {i}")
             continue
 
-        if len(frame.shape) == 2:
-            frame = cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
-        full_frame = frame.copy()
+        frame = _to_bgr(frame)
+        # no copy: crop/flip return views, so 'frame' itself stays the untouched original
+        full_frame = frame
         crop_box = None
         if args.crop_frac < 1.0:
             try:
@@ -164,19 +164,10 @@ def timer_capture(args, cap: cv2.VideoCapture):
                 print(f"[capture] WARN: crop/flip failed ({e}). Using full frame.")
                 frame, crop_box = full_frame, None
 
-        if args.save_full:
-            try:
-                _save_jpg(jpg_path.replace(".jpg", "_full.jpg"), full_frame)
-            except Exception as e:
-                print(f"[capture] WARN: failed to save *_full.jpg ({e})")
-        # save the (possibly cropped) working image
-        try:
-            _save_jpg(jpg_path, frame)
-        except Exception as e:
-            print(f"[capture] ERROR: {e}")
-            continue
-
-        _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=None)
-
-        if args.vlm:
-            prep_vlm(args, jpg_path, pose, json_path)
\ No newline at end of file
+        # save the (possibly cropped) working image (+ original), sidecar, VLM in the background
+        _save_capture_async(
+            jpg_path, frame, json_path, pose,
+            full_frame=full_frame if args.save_full else None,
+            then=partial(vlm.submit, jpg_path, pose, json_path) if vlm else None,
+            sidecar=vlm is None,
+        )
\ No newline at end of file
@@ -1,61 +1,206 @@
-import os, json, time, cv2, glob, datetime, re
+import os, sys, time, cv2, re, mmap, threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Optional, Tuple
+import numpy as np
 
-_POSE_NAME_RES = [
-    re.compile(
-        r".*?/x(?P<x>-?\d{1,6})y(?P<y>-?\d{1,6})z(?P<z>-?\d{1,6})yaw(?P<yaw>-?\d{1,9})(?:__[^/]+)?\.[A-Za-z0-9]+$"
-    ),
-    re.compile(
-        r".*?_x(?P<x>-?\d+(?:\.\d+)?)_y(?P<y>-?\d+(?:\.\d+)?)_z(?P<z>-?\d+(?:\.\d+)?)_yaw(?P<yaw>-?\d+(?:\.\d+)?)(?:\.[A-Za-z0-9]+)$"
-    ),
-]
-def _update_sidecar_json(json_path: str, pose: dict, image_basename: str, vlm_text: Optional[str]):
-    obj = {}
-    if os.path.isfile(json_path):
-        try:
-            with open(json_path, "r") as f:
-                obj = json.load(f)
-        except Exception:
-            obj = {}
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root: json_helper
+import json_helper as _json  # the module file is not _json.py: that name is the stdlib json accelerator
+
+# Both filename formats in one anchored pattern, matched against the basename only:
+#   compact ints  x0012y-0034z1500yaw0001234__<stamp>.jpg  (mm / microrad)
+#   legacy floats <prefix>_x0.12_y-0.3_z1.5_yaw0.1.jpg     (m / rad)
+# (used with fullmatch; names without "yaw" are rejected before the regex runs)
+_POSE_NAME_RE = re.compile(
+    r"(?:x(?P<xi>-?\d{1,6})y(?P<yi>-?\d{1,6})z(?P<zi>-?\d{1,6})yaw(?P<yawi>-?\d{1,9})(?:__[^/]+)?"
+    r"|.*?_x(?P<xf>-?\d+(?:\.\d+)?)_y(?P<yf>-?\d+(?:\.\d+)?)_z(?P<zf>-?\d+(?:\.\d+)?)_yaw(?P<yawf>-?\d+(?:\.\d+)?))"
+    r"\.[A-Za-z0-9]+\n?"     # \n? keeps the old '$' behaviour
+)
+def _merge_sidecar(obj: dict, pose: dict, image_basename: str, vlm_text: Optional[str], ts: int) -> dict:
     obj.setdefault("pose", pose)
     obj.setdefault("image", image_basename)
     if vlm_text:
         obj["vlm_caption"] = vlm_text
         entries = obj.setdefault("entries", [])
         entries.append({
-            "timestamp": int(time.time()),
+            "timestamp": ts,
             "prompt": "Describe the image",
             "response": vlm_text
         })
+    return obj
+
+def _read_sidecar(json_path: str) -> dict:
+    if os.path.isfile(json_path):
+        try:
+            with open(json_path, "rb") as f:
+                return _json.loads(f.read())
+        except Exception:
+            pass
+    return {}
+
+def _write_sidecar(json_path: str, obj: dict, payload: Optional[bytes] = None):
     tmp = json_path + ".tmp"
-    with open(tmp, "w") as f:
-        json.dump(obj, f, indent=2)
+    with open(tmp, "wb") as f:
+        f.write(_json.dumps(obj, indent=2) if payload is None else payload)
     os.replace(tmp, json_path)
 
+def _update_sidecar_json(json_path: str, pose: dict, image_basename: str, vlm_text: Optional[str]):
+    if _CAPTURE_LOG is not None:
+        # --captures-log: one appended line now, the sidecar is built at close_capture_log()
+        rec = {"ts": int(time.time()), "json": json_path, "pose": pose,
+               "image": image_basename, "vlm": vlm_text}
+        os.write(_CAPTURE_LOG[0], _json.dumps(rec) + b"\n")
+        return
+    with _SIDECAR_LOCK:
+        obj, on_disk = _cached_sidecar(json_path)
+        # merge into a copy: the cached dict must keep matching the file until os.replace succeeds
+        obj = dict(obj)
+        if isinstance(obj.get("entries"), list):
+            obj["entries"] = list(obj["entries"])
+        obj = _merge_sidecar(obj, pose, image_basename, vlm_text, int(time.time()))
+        payload = _json.dumps(obj, indent=2)
+        digest = hash(payload)
+        if digest == on_disk:
+            return  # same bytes as the file already holds (e.g. a pose-only re-save)
+        _write_sidecar(json_path, obj, payload)
+        st = os.stat(json_path)
+        _SIDECAR_CACHE[json_path] = (st.st_mtime_ns, st.st_size, obj, digest)
+        _SIDECAR_CACHE.move_to_end(json_path)
+        if len(_SIDECAR_CACHE) > _SIDECAR_CACHE_MAX:
+            _SIDECAR_CACHE.popitem(last=False)
+
+# Sidecars this process wrote recently, so a follow-up update (e.g. the VLM caption)
+# merges into the in-memory dict instead of re-reading and parsing the file. An entry is
+# trusted only while the file's (mtime, size) still match what we wrote; the digest of
+# the written bytes lets an update that changes nothing skip the rewrite.
+_SIDECAR_CACHE = OrderedDict()   # json_path -> (mtime_ns, size, obj, hash(bytes))
+_SIDECAR_CACHE_MAX = 256
+_SIDECAR_LOCK = threading.Lock()
+
+def _cached_sidecar(json_path: str):
+    """(dict to merge into, hash of the file's current bytes or None if there is no file)."""
+    try:
+        st = os.stat(json_path)
+    except OSError:
+        _SIDECAR_CACHE.pop(json_path, None)
+        return {}, None
+    hit = _SIDECAR_CACHE.get(json_path)
+    if hit is not None and hit[:2] == (st.st_mtime_ns, st.st_size):
+        return hit[2], hit[3]
+    try:
+        with open(json_path, "rb") as f:
+            raw = f.read()
+        return _json.loads(raw), hash(raw)
+    except Exception:
+        return {}, None
+
+# ---- --captures-log: per-session captures.jsonl instead of per-capture sidecar rewrites ----
+_CAPTURE_LOG = None  # (fd, path) while open
+
+def open_capture_log(out_dir: str) -> str:
+    """Send sidecar updates to <out_dir>/captures.jsonl (O_APPEND, one write() per record)."""
+    global _CAPTURE_LOG
+    path = os.path.join(out_dir, "captures.jsonl")
+    _CAPTURE_LOG = (os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644), path)
+    return path
+
+def close_capture_log() -> int:
+    """Stop logging and write each <image>.json once from captures.jsonl; returns the sidecar count."""
+    global _CAPTURE_LOG
+    if _CAPTURE_LOG is None:
+        return 0
+    fd, path = _CAPTURE_LOG
+    _CAPTURE_LOG = None
+    os.close(fd)
+    sidecars = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                rec = _json.loads(line)
+            except ValueError:
+                continue  # torn last line after a crash
+            jp = rec["json"]
+            obj = sidecars.get(jp)
+            if obj is None:
+                obj = sidecars[jp] = _read_sidecar(jp)
+            _merge_sidecar(obj, rec["pose"], rec["image"], rec.get("vlm"), rec["ts"])
+    for jp, obj in sidecars.items():
+        _write_sidecar(jp, obj)
+    return len(sidecars)
+
+_FRAME_EXTS = frozenset((".jpg", ".jpeg", ".png", ".bmp"))
+
+_FRAMES_CACHE = {}  # frames_dir -> (dir mtime_ns, sorted paths)
+
 def list_frames(frames_dir: str):
-    exts = ("*.jpg","*.jpeg","*.png","*.bmp")
-    files = []
-    for ext in exts:
-        files.extend(glob.glob(os.path.join(frames_dir, ext)))
-    return sorted(files)
+    # one directory pass instead of a glob per extension; hidden files skipped like glob.
+    # Re-scanned only when the directory's mtime changes (files added/removed/renamed).
+    try:
+        mtime = os.stat(frames_dir).st_mtime_ns
+        hit = _FRAMES_CACHE.get(frames_dir)
+        if hit is not None and hit[0] == mtime:
+            return list(hit[1])
+        with os.scandir(frames_dir) as it:
+            files = [e.path for e in it
+                     if not e.name.startswith(".") and os.path.splitext(e.name)[1].lower() in _FRAME_EXTS
+                     and e.is_file()]
+    except (FileNotFoundError, NotADirectoryError):
+        return []  # glob returned nothing for a missing dir; callers report "no images"
+    files.sort()
+    _FRAMES_CACHE[frames_dir] = (mtime, tuple(files))
+    return files
+
+# Shared fallback pose (callers only read poses; sidecars serialize them as-is)
+_DEFAULT_POSE = {"x": 0.0, "y": 0.0, "z": 1.5, "yaw": 0.0}
 
 def get_pose_for_frame(path: str, *, angles_map: dict, from_name: bool):
+    base = os.path.basename(path)
     if from_name:
-        p = parse_pose_from_name(path)
-        if p:
-            return p
-    p = angles_map.get(os.path.basename(path))
+        t = _pose_from_base(base)
+        if t is not None:
+            return dict(zip(_POSE_KEYS, t))
+    p = angles_map.get(base)
     if isinstance(p, dict): return p
-    return {"x":0.0,"y":0.0,"z":1.5,"yaw":0.0}
+    return _DEFAULT_POSE
+
+def frame_poses(frames, *, angles_map: dict, from_name: bool) -> dict:
+    """{path: pose} for a whole listing, resolved once up front (folder loops index it per frame)."""
+    return {p: get_pose_for_frame(p, angles_map=angles_map, from_name=from_name) for p in frames}
+
+_TS_CACHE = [0, ""]  # [epoch second, formatted stamp]
+
+def _now_stamp() -> str:
+    """Local 'YYYY_MM_DD___HH_MM_SS', formatted once per wall-clock second."""
+    sec = int(time.time())
+    if _TS_CACHE[0] != sec:
+        _TS_CACHE[1] = time.strftime("%Y_%m_%d___%H_%M_%S", time.localtime(sec))
+        _TS_CACHE[0] = sec
+    return _TS_CACHE[1]
+
+def _fmt_pose(x_mm: int, y_mm: int, z_mm: int, yaw_ur: int) -> str:
+    """Pose stem from integer mm / microrad: zero-padded to 4/4/4/7 digits, '-' prefixed outside the padding."""
+    return (f"x{'-' if x_mm < 0 else ''}{abs(x_mm):04d}"
+            f"y{'-' if y_mm < 0 else ''}{abs(y_mm):04d}"
+            f"z{'-' if z_mm < 0 else ''}{abs(z_mm):04d}"
+            f"yaw{'-' if yaw_ur < 0 else ''}{abs(yaw_ur):07d}")
 
 def pose_to_name(pose: dict) -> str:
-    x = _fmt_signed(pose["x"],   scale=1000,      width=4, eps=5e-4)     # mm
-    y = _fmt_signed(pose["y"],   scale=1000,      width=4, eps=5e-4)     # mm
-    z = _fmt_signed(pose["z"],   scale=1000,      width=4, eps=5e-4)     # mm
-    yaw = _fmt_signed(pose["yaw"], scale=1_000_000, width=7, eps=5e-7)   # microrad
-    timestamp = datetime.datetime.now().strftime("%Y_%m_%d___%H_%M_%S")
+    return pose_xyz_to_name(pose["x"], pose["y"], pose["z"], pose["yaw"])
+
+def pose_xyz_to_name(px: float, py: float, pz: float, pyaw: float) -> str:
+    """pose_to_name() for callers that already hold the four floats (m / rad)."""
+    stem = _fmt_pose(
+        0 if abs(px) < 5e-4 else int(round(px * 1000)),          # mm
+        0 if abs(py) < 5e-4 else int(round(py * 1000)),          # mm
+        0 if abs(pz) < 5e-4 else int(round(pz * 1000)),          # mm
+        0 if abs(pyaw) < 5e-7 else int(round(pyaw * 1_000_000)), # microrad
+    )
+    timestamp = _now_stamp()
 
-    return f"x{x}y{y}z{z}yaw{yaw}__{timestamp}"
+    return f"{stem}__{timestamp}"
 
 def center_crop_frac(img, frac: float):
     """
@@ -69,20 +214,25 @@ def center_crop_frac(img, frac: float):
     y0 = (H - ch) // 2
     return img[y0:y0+ch, x0:x0+cw], (x0, y0, x0+cw, y0+ch)
 
-def _apply_crop_and_flip(img, crop_frac: float, flip180: bool):
-    """Center-crop then optionally rotate 180°."""
+def _apply_crop_and_flip(img, crop_frac: float, flip180: bool, dst=None):
+    """
+    Center-crop then optionally rotate 180°.
+    Both steps are numpy views (no pixel copy); the encoder makes the one contiguous copy
+    when the JPEG is written. If 'dst' is a preallocated array of the cropped shape/dtype
+    the rotation is materialized into it instead.
+    """
     work = img
     crop_box = None
     if crop_frac < 1.0:
         # assumes you already have center_crop_frac(img, frac) -> (cropped, (x1,y1,x2,y2))
         work, crop_box = center_crop_frac(img, crop_frac)
     if flip180:
-        work = cv2.rotate(work, cv2.ROTATE_180)
+        if dst is not None and dst.shape == work.shape and dst.dtype == work.dtype:
+            work = cv2.flip(work, -1, dst=dst)
+        else:
+            work = work[::-1, ::-1]
     return work, crop_box
 
-import cv2
-import numpy as np
-
 def correct_histogram(image: np.ndarray, method: str = "clahe") -> np.ndarray:
     """
     Apply histogram correction to enhance image contrast.
@@ -111,53 +261,369 @@ def correct_histogram(image: np.ndarray, method: str = "clahe") -> np.ndarray:
     else:
         raise ValueError("Unsupported image format")
 
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR
+    _TJ = TurboJPEG()          # raises if libturbojpeg itself is missing
+except Exception:
+    _TJ = None
+
+_JPEG_QUALITY = 95  # cv2.imwrite's default, so both encoders produce comparable files
+
+# Optional Jetson hardware JPEG (--hw-jpeg): nvjpegenc through a GStreamer
+# appsrc → appsink pipeline, so the encoded bytes still go through _write_bytes.
+try:
+    import gi
+    gi.require_version("Gst", "1.0")
+    from gi.repository import Gst
+except Exception:
+    Gst = None
+
+class _NvJpegEncoder:
+    """One appsrc ! nvvidconv ! nvjpegenc ! appsink pipeline, rebuilt when the frame size changes."""
+    def __init__(self, quality: int):
+        self.quality = quality
+        self._lock = threading.Lock()   # one frame in the pipeline at a time
+        self._pipe = self._src = self._sink = None
+        self._size = None
+
+    def _build(self, h: int, w: int):
+        if self._pipe is not None:
+            self._pipe.set_state(Gst.State.NULL)
+        pipe = Gst.parse_launch(
+            f"appsrc name=src do-timestamp=true format=time "
+            f"caps=video/x-raw,format=BGR,width={w},height={h},framerate=0/1 "
+            f"! videoconvert ! video/x-raw,format=BGRx "             # nvvidconv takes BGRx, not BGR
+            f"! nvvidconv ! video/x-raw(memory:NVMM),format=I420 "
+            f"! nvjpegenc quality={self.quality} ! appsink name=sink sync=false max-buffers=1"
+        )
+        if pipe.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            raise RuntimeError("nvjpegenc pipeline failed to start")
+        self._pipe, self._size = pipe, (h, w)
+        self._src, self._sink = pipe.get_by_name("src"), pipe.get_by_name("sink")
+
+    def encode(self, bgr) -> bytes:
+        h, w = bgr.shape[:2]
+        with self._lock:
+            if self._size != (h, w):
+                self._build(h, w)
+            self._src.emit("push-buffer", Gst.Buffer.new_wrapped(np.ascontiguousarray(bgr).tobytes()))
+            sample = self._sink.emit("try-pull-sample", Gst.SECOND)
+            if sample is None:
+                raise RuntimeError("nvjpegenc produced no frame")
+            buf = sample.get_buffer()
+            return buf.extract_dup(0, buf.get_size())
+
+_HW_JPEG: Optional[_NvJpegEncoder] = None
+
+def enable_hw_jpeg() -> bool:
+    """Route _encode_jpg through nvjpegenc when GStreamer (gi) and a Jetson are present."""
+    global _HW_JPEG
+    if Gst is None or not any(n.startswith("nvhost-") for n in os.listdir("/dev")):
+        print("[capture] WARN: --hw-jpeg needs GStreamer (python3-gi) on a Jetson; using the CPU encoder")
+        return False
+    Gst.init(None)
+    _HW_JPEG = _NvJpegEncoder(_JPEG_QUALITY)
+    return True
+
+def _encode_jpg(bgr) -> bytes:
+    global _HW_JPEG
+    is_bgr8 = bgr.ndim == 3 and bgr.shape[2] == 3 and bgr.dtype == np.uint8
+    if _HW_JPEG is not None and is_bgr8:
+        try:
+            return _HW_JPEG.encode(bgr)
+        except Exception as e:
+            print(f"[capture] WARN: hardware JPEG failed ({e}); switching to the CPU encoder")
+            _HW_JPEG = None
+    # libjpeg-turbo (SIMD) when PyTurboJPEG is available, OpenCV's encoder otherwise
+    if _TJ is not None and is_bgr8:
+        return _TJ.encode(np.ascontiguousarray(bgr), quality=_JPEG_QUALITY, pixel_format=TJPF_BGR)
+    ok, buf = cv2.imencode(".jpg", bgr, [cv2.IMWRITE_JPEG_QUALITY, _JPEG_QUALITY])
+    if not ok:
+        raise RuntimeError("JPEG encode failed")
+    return buf.tobytes()
+
+def _write_bytes(path: str, data: bytes):
+    """Write the whole file with one open + write() (loop only on short writes)."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
 def _save_jpg(path: str, bgr):
-    if not cv2.imwrite(path, bgr):
-        raise RuntimeError(f"failed to write {path}")
+    try:
+        _write_bytes(path, _encode_jpg(bgr))
+    except (OSError, RuntimeError) as e:
+        raise RuntimeError(f"failed to write {path}: {e}") from e
+
+# ---- --pack: append-only frame pack for the *_full.jpg debug copies ----
+# One frames.pack (concatenated JPEGs) plus frames.idx (one JSON line per frame:
+# name/offset/length/pose) per session, instead of a new file + directory entry per
+# capture. Each frame is a single write() on an O_APPEND fd; offsets are assigned
+# under a lock so the IO pool workers can share one pack.
+class FramePack:
+    def __init__(self, out_dir: str, name: str = "frames"):
+        self.path = os.path.join(out_dir, name + ".pack")
+        self.index_path = os.path.join(out_dir, name + ".idx")
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        self._fd = os.open(self.path, flags, 0o644)
+        self._idx_fd = os.open(self.index_path, flags, 0o644)
+        self._off = os.fstat(self._fd).st_size
+        self._lock = threading.Lock()
+
+    def append(self, name: str, data: bytes, pose: Optional[dict] = None) -> int:
+        with self._lock:
+            off = self._off
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._fd, view):]
+            self._off += len(data)
+            rec = {"name": name, "offset": off, "length": len(data), "pose": pose}
+            os.write(self._idx_fd, _json.dumps(rec) + b"\n")
+        return off
+
+    def close(self):
+        with self._lock:
+            for fd in (self._fd, self._idx_fd):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+class PackReader:
+    """Random access to a FramePack: imread(name) decodes straight out of an mmap."""
+    def __init__(self, pack_path: str):
+        self._f = open(pack_path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index = {}
+        with open(os.path.splitext(pack_path)[0] + ".idx", "rb") as f:
+            for line in f:
+                if line.strip():
+                    rec = _json.loads(line)
+                    self.index[rec["name"]] = rec
+
+    def imread(self, name: str, flags=cv2.IMREAD_COLOR):
+        rec = self.index[name]
+        buf = np.frombuffer(self._mm, np.uint8, count=rec["length"], offset=rec["offset"])
+        return cv2.imdecode(buf, flags)
+
+    def close(self):
+        self._mm.close()
+        self._f.close()
 
+_FULL_PACK: Optional[FramePack] = None
 
-def _fmt_signed(value: float, scale: int, width: int, eps: float) -> str:
-    if abs(value) < eps:
-        value = 0.0
-    n = int(round(value * scale))
-    if n < 0:
-        return f"-{abs(n):0{width}d}"
+def open_full_pack(out_dir: str) -> FramePack:
+    """Route *_full.jpg saves into <out_dir>/frames.pack for the rest of the session."""
+    global _FULL_PACK
+    _FULL_PACK = FramePack(out_dir)
+    return _FULL_PACK
+
+def close_full_pack():
+    global _FULL_PACK
+    if _FULL_PACK is not None:
+        _FULL_PACK.close()
+        _FULL_PACK = None
+
+def _save_full(jpg_path: str, full_frame=None, data: Optional[bytes] = None, pose: Optional[dict] = None):
+    """Write the *_full.jpg debug copy (to the pack when --pack is on); pass data= to reuse an encode."""
+    full_path = jpg_path[:-4] + "_full.jpg"   # capture names always end in ".jpg"
+    if data is None:
+        data = _encode_jpg(full_frame)
+    if _FULL_PACK is not None:
+        _FULL_PACK.append(os.path.basename(full_path), data, pose)
     else:
-        return f"{n:0{width}d}"
+        _write_bytes(full_path, data)
 
-def parse_pose_from_name(fname: str):
-    base = os.path.basename(fname)
-    for rx in _POSE_NAME_RES:
-        m = rx.match(fname) or rx.match(base)
-        if not m:
-            continue
-        gd = m.groupdict()
-        # If the captures are integers (mm / microrad), convert to meters / radians
+
+# ---- camera reader shared by every live capture mode ----
+
+class LatestFrameGrabber(threading.Thread):
+    """
+    Reads the camera continuously on its own thread and keeps only the newest frame,
+    so a capture takes the freshest frame immediately instead of flushing the buffer
+    with grab()+sleep and retrying read() inline.
+
+    decode=True (preview/timer loops, which use most frames): frames are decoded into
+    two alternating buffers (read(image=...)), so the steady state allocates nothing; a
+    buffer handed out by get() is detached and replaced by a fresh one, so frames queued
+    for saving are never overwritten.
+    decode=False (edge-triggered captures, which use few frames): the thread only calls
+    cap.grab() (OpenCV drops the GIL for it) and get() decodes just the newest frame with
+    cap.retrieve(); the thread parks on an Event, not a poll, while that runs.
+    """
+    def __init__(self, cap: cv2.VideoCapture, decode: bool = True):
+        super().__init__(name="capture-reader", daemon=True)
+        self.cap = cap
+        self.decode = decode
+        self._latest = (False, None)
+        self._bufs = [None, None]        # read targets; None = let OpenCV allocate
+        self._slot = 0                   # slot holding _latest
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._new = threading.Event()    # set on every frame, cleared by get(fresh=True)
+        self._may_grab = threading.Event()   # decode=False: cleared while get() retrieves
+        self._may_grab.set()
+        self._halt = threading.Event()
+
+    def run(self):
+        if self.decode:
+            self._read_loop()
+        else:
+            self._grab_loop()
+
+    def _read_loop(self):
+        i = 1
+        while not self._halt.is_set():
+            with self._lock:
+                buf = self._bufs[i]
+            ok, frame = self.cap.read(image=buf) if buf is not None else self.cap.read()
+            if not ok or frame is None:
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                self._bufs[i] = frame    # same array unless OpenCV had to reallocate
+                self._latest, self._slot = (ok, frame), i
+            i ^= 1
+            self._ready.set()
+            self._new.set()
+
+    def _grab_loop(self):
+        while not self._halt.is_set():
+            self._may_grab.wait()
+            with self._lock:
+                ok = self.cap.grab()
+            if not ok:
+                time.sleep(0.01)
+                continue
+            self._ready.set()
+            self._new.set()
+
+    def get(self, timeout: float = 1.0, fresh: bool = False):
+        """
+        Newest (ok, frame), owned by the caller; waits up to 'timeout' s for the first
+        frame, or with fresh=True for a frame not returned by a previous fresh get
+        (paces preview loops).
+        """
+        if fresh:
+            self._new.wait(timeout)
+            self._new.clear()
+        else:
+            self._ready.wait(timeout)
+        if not self.decode:
+            self._may_grab.clear()
+            try:
+                with self._lock:
+                    return self.cap.retrieve()
+            finally:
+                self._may_grab.set()
+        with self._lock:
+            if self._latest[1] is not None and self._bufs[self._slot] is self._latest[1]:
+                self._bufs[self._slot] = None    # caller owns it now
+            return self._latest
+
+    def stop(self):
+        self._halt.set()
+        self._may_grab.set()
+        self.join(timeout=1.0)
+
+
+# ---- background saves ----
+# JPEG encode/write + sidecar (+ optional follow-up such as the VLM call) run on a small
+# pool (~25% of cores) so the capture loop only hands frames over. At most
+# _MAX_PENDING saves are in flight; beyond that the caller waits for the oldest.
+_IO_POOL = ThreadPoolExecutor(max_workers=max(1, (os.cpu_count() or 4) // 4), thread_name_prefix="capture-io")
+_pending = deque()
+_MAX_PENDING = 16
+
+# Reusable output buffers for full-frame conversions (cv2 dst=). Frames handed to the
+# savers stay alive until written, so each (tag, shape, dtype) gets a ring deep enough
+# for every capture that can still be in flight; slots are allocated on first use.
+_SCRATCH = {}
+
+def _scratch_like(shape, dtype, tag: str = "", ring: int = _MAX_PENDING + 2):
+    key = (tag, tuple(shape), np.dtype(dtype).str)
+    slot = _SCRATCH.get(key)
+    if slot is None:
+        slot = _SCRATCH[key] = [[], 0]
+    bufs, pos = slot
+    if len(bufs) < ring:
+        bufs.append(np.empty(shape, dtype=dtype))
+        return bufs[-1]
+    slot[1] = (pos + 1) % ring
+    return bufs[pos]
+
+def _to_bgr(frame, tag: str = "bgr", ring: int = _MAX_PENDING + 2):
+    """Gray → BGR into a reused scratch buffer; BGR frames pass through untouched."""
+    if frame.ndim != 2:
+        return frame
+    dst = _scratch_like(frame.shape + (3,), frame.dtype, tag, ring)
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst=dst)
+
+def _save_capture(jpg_path: str, frame, json_path: str, pose: dict, full_frame=None,
+                  done_msg: Optional[str] = None, tag: str = "[capture]", then=None,
+                  sidecar: bool = True):
+    # sidecar=False when 'then' (VLMClient.submit) writes it anyway: one sidecar write per capture
+    if full_frame is not None:
         try:
-            # compact-int format → ints
-            x_mm   = int(gd["x"])
-            y_mm   = int(gd["y"])
-            z_mm   = int(gd["z"])
-            yaw_ur = int(gd["yaw"])   # microradians
-            return {
-                "x": x_mm / 1000.0,
-                "y": y_mm / 1000.0,
-                "z": z_mm / 1000.0,
-                "yaw": yaw_ur / 1_000_000.0,
-            }
-        except ValueError:
-            # legacy underscore/float format → floats already in meters/radians
-            return {
-                "x": float(gd["x"]),
-                "y": float(gd["y"]),
-                "z": float(gd["z"]),
-                "yaw": float(gd["yaw"]),
-            }
-    return None
+            _save_full(jpg_path, full_frame, pose=pose)
+        except Exception as e:
+            print(f"{tag} WARN: save *_full.jpg failed: {e}")
+    _save_jpg(jpg_path, frame)
+    if sidecar:
+        _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=None)
+    if done_msg:
+        print(done_msg)
+    if then is not None:
+        then()
+
+def _reap(fut, tag: str = "[capture]"):
+    try:
+        fut.result()
+    except Exception as e:
+        print(f"{tag} ERROR: {e}")
+
+def _save_capture_async(jpg_path: str, frame, json_path: str, pose: dict, **kw):
+    """Queue _save_capture(...) on the IO pool; the sidecar is written after the JPEG(s)."""
+    while len(_pending) >= _MAX_PENDING or (_pending and _pending[0].done()):
+        _reap(_pending.popleft(), kw.get("tag", "[capture]"))
+    _pending.append(_IO_POOL.submit(_save_capture, jpg_path, frame, json_path, pose, **kw))
+
+def _drain_pending(tag: str = "[capture]"):
+    """Wait for every queued save (call when a capture loop exits)."""
+    while _pending:
+        _reap(_pending.popleft(), tag)
+
+
+_POSE_KEYS = ("x", "y", "z", "yaw")
+
+@lru_cache(maxsize=65536)
+def _pose_from_base(base: str):
+    """(x, y, z, yaw) in m / rad parsed from a frame basename, or None. Pure, so memoized."""
+    m = _POSE_NAME_RE.fullmatch(base) if "yaw" in base else None
+    if not m:
+        return None
+    if m.group("xi") is not None:
+        x, y, z, yaw = m.group("xi", "yi", "zi", "yawi")
+    else:
+        x, y, z, yaw = m.group("xf", "yf", "zf", "yawf")
+    # If the captures are integers (mm / microrad), convert to meters / radians
+    try:
+        # compact-int format → ints
+        return (int(x) / 1000.0, int(y) / 1000.0, int(z) / 1000.0, int(yaw) / 1_000_000.0)
+    except ValueError:
+        # legacy underscore/float format → floats already in meters/radians
+        return (float(x), float(y), float(z), float(yaw))
+
+def parse_pose_from_name(fname: str):
+    t = _pose_from_base(os.path.basename(fname))
+    return None if t is None else dict(zip(_POSE_KEYS, t))
 
 def load_angles_map(path: str):
     try:
-        with open(path, "r") as f: j = json.load(f)
+        with open(path, "rb") as f: j = _json.loads(f.read())
         return j if isinstance(j, dict) else {}
     except Exception:
         return {}
@@ -166,7 +632,7 @@ def _unique_name(base_path: str, enable_suffix: bool, counter: int) -> Tuple[str
     """
     Return (jpg_path, json_path). If enable_suffix, append _0001, _0002...
     """
-    timestamp = datetime.datetime.now().strftime("%Y_%m_%d___%H_%M_%S")
+    timestamp = _now_stamp()
     base_path = f"{base_path}___{timestamp}"
     jpg_path = base_path + ".jpg"
     json_path = base_path + ".json"
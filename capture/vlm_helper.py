@@ -1,9 +1,49 @@
 import requests
-import json
 import time
 import os
+import sys
+import queue
+import threading
+from functools import lru_cache
 from typing import Optional
+from requests.adapters import HTTPAdapter
 from txt_and_image_utils import _update_sidecar_json
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # repo root: json_helper
+import json_helper as _json
+
+try:
+    from urllib3.util.retry import Retry
+except ImportError:  # very old requests: vendored urllib3
+    from requests.packages.urllib3.util.retry import Retry
+
+# urllib3 < 1.26 spells allowed_methods "method_whitelist"
+_RETRY_METHODS_KW = "allowed_methods" if hasattr(Retry, "DEFAULT_ALLOWED_METHODS") else "method_whitelist"
+_RETRY_METHODS = frozenset(getattr(Retry, "DEFAULT_ALLOWED_METHODS", None)
+                           or Retry.DEFAULT_METHOD_WHITELIST) | {"POST"}
+# gateway/unavailable replies: the describe was not processed, so re-sending is safe
+_RETRY_STATUSES = (502, 503, 504)
+
+@lru_cache(maxsize=None)
+def _session_for(attempts: int) -> requests.Session:
+    """
+    Module-wide keep-alive session per attempt budget: every capture mode reuses the TCP
+    connection to the VLM server. Connect errors and 502/503/504 (e.g. a server still
+    warming up) are retried inside urllib3 with exponential backoff; read timeouts and
+    other statuses are not: such a describe POST may already be running inference, and
+    re-sending it - a whole image_paths batch included - would caption it again.
+    """
+    n = max(1, attempts) - 1   # attempts -> retries after the first try
+    retry = Retry(total=n, connect=n, read=0, status=n, backoff_factor=0.2,
+                  status_forcelist=_RETRY_STATUSES, raise_on_status=False,
+                  **{_RETRY_METHODS_KW: _RETRY_METHODS})
+    session = requests.Session()
+    session.headers["Content-Type"] = "application/json"
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
 def _remap_path(local_path: str, src_root: Optional[str], dst_root: Optional[str]) -> str:
     if not src_root or not dst_root:
         return os.path.abspath(local_path)
@@ -15,37 +55,177 @@ def _remap_path(local_path: str, src_root: Optional[str], dst_root: Optional[str
         return local_path
     return os.path.join(dst_root, rel)
 
-def prep_vlm(args, jpg_path, pose, json_path):
-    img_for_vlm = _remap_path(jpg_path,
-                              args.vlm_path_src or None,
-                              args.vlm_path_dst or None)
-    print(f"[vlm] POST {args.vlm}  image_path={img_for_vlm}")
-    vlm_caption = _call_vlm(args.vlm, img_for_vlm, args.vlm_timeout, args.vlm_retries)
-    if vlm_caption:
-        print(f"[vlm] caption: {vlm_caption[:120]}{'…' if len(vlm_caption) > 120 else ''}")
-    else:
-        print("[vlm] WARN: no caption returned")
-    _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=vlm_caption)
-
+def _caption_from(data) -> str:
+    if isinstance(data, dict):
+        return data.get("response") or data.get("caption") or _json.dumps(data).decode("utf-8")
+    return _json.dumps(data).decode("utf-8")
 
-def _call_vlm(endpoint: Optional[str], image_path_for_vlm: str, timeout: float, retries: int) -> Optional[str]:
+def _call_vlm(endpoint: Optional[str], image_path_for_vlm: str, timeout: float, retries: int,
+              session: Optional[requests.Session] = None) -> Optional[str]:
     if not endpoint:
         return None
-    payload = {"image_path": image_path_for_vlm}
-    last_err = None
-    for _ in range(max(1, retries)):
+    payload = _json.dumps({"image_path": image_path_for_vlm})
+    try:
+        r = (session or _session_for(retries)).post(endpoint, data=payload, timeout=timeout)
+        r.raise_for_status()
+    except Exception as e:
+        print(f"[vlm] WARN: describe failed for {image_path_for_vlm}: {e}")
+        return None
+    try:
+        return _caption_from(_json.loads(r.content))
+    except ValueError:
+        return r.text.strip()
+
+
+class VLMClient:
+    """
+    Background describe client. submit() only enqueues; a worker collects up to batch_max
+    requests (waiting at most batch_wait s after the first one), sends them as a single
+    {"image_paths": [...]} POST, and hands the captions to a writer thread that updates
+    the sidecars. A 400 (server without batch support), a 5xx or a malformed batch reply
+    falls back to one POST per image; a read timeout does not (see _describe_batch).
+    """
+    def __init__(self, endpoint: str, timeout: float, retries: int, batch_max: int = 4,
+                 batch_wait: float = 0.05, path_src: Optional[str] = None, path_dst: Optional[str] = None,
+                 session: Optional[requests.Session] = None, maxsize: int = 64):
+        self.endpoint, self.timeout, self.retries = endpoint, timeout, retries
+        self.batch_max, self.batch_wait = max(1, batch_max), max(0.0, batch_wait)
+        self.path_src, self.path_dst = path_src, path_dst
+        self.session = session or _session_for(retries)
+        self._batch_ok = self.batch_max > 1
+        self._req = queue.Queue(maxsize=maxsize)   # (jpg_path, pose, json_path, remote_path) | None
+        self._out = queue.Queue()                  # ((jpg_path, pose, json_path, remote_path), caption) | None
+        self._sender = threading.Thread(target=self._send_loop, name="vlm-batch", daemon=True)
+        self._writer = threading.Thread(target=self._write_loop, name="vlm-sidecar", daemon=True)
+        self._sender.start()
+        self._writer.start()
+
+    def submit(self, jpg_path: str, pose: dict, json_path: str, block: bool = True) -> bool:
+        """Queue one describe; the sidecar is written when the caption (or None) is in.
+        False (nothing queued) if block=False and the backlog is full."""
+        item = (jpg_path, pose, json_path, _remap_path(jpg_path, self.path_src, self.path_dst))
         try:
-            r = requests.post(endpoint, json=payload, timeout=timeout)
-            r.raise_for_status()
+            self._req.put(item, block=block)
+        except queue.Full:
+            return False
+        return True
+
+    def _send_loop(self):
+        stop = False
+        while not stop:
+            item = self._req.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_max:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    item = self._req.get(timeout=left)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
             try:
-                data = r.json()
-                if isinstance(data, dict):
-                    return data.get("response") or data.get("caption") or json.dumps(data, ensure_ascii=False)
-                return json.dumps(data, ensure_ascii=False)
-            except ValueError:
-                return r.text.strip()
+                captions = self._describe([b[3] for b in batch])
+            except Exception as e:
+                print(f"[vlm] ERROR: {e}")
+                captions = [None] * len(batch)
+            for b, caption in zip(batch, captions):
+                self._out.put((b, caption))
+        self._out.put(None)
+
+    def _describe(self, paths):
+        if len(paths) > 1 and self._batch_ok:
+            captions = self._describe_batch(paths)
+            if captions is not None:
+                return captions
+        out = []
+        for p in paths:
+            print(f"[vlm] POST {self.endpoint}  image_path={p}")
+            out.append(_call_vlm(self.endpoint, p, self.timeout, self.retries, session=self.session))
+        return out
+
+    def _describe_batch(self, paths):
+        """
+        Captions for every path from one POST (None where the server failed that image),
+        or None to fall back to one request per image. A read timeout is final: the server
+        may still be captioning the batch, so it is not sent again.
+        """
+        print(f"[vlm] POST {self.endpoint}  image_paths[{len(paths)}]")
+        payload = _json.dumps({"image_paths": paths})
+        try:
+            # the server describes the images one after another
+            r = self.session.post(self.endpoint, data=payload, timeout=self.timeout * len(paths))
+        except requests.exceptions.ReadTimeout as e:
+            print(f"[vlm] WARN: batch describe timed out for {len(paths)} images: {e}")
+            return [None] * len(paths)
+        except Exception as e:
+            print(f"[vlm] WARN: batch describe failed ({e}); sending one image per request")
+            return None
+        if r.status_code == 400:
+            print("[vlm] server has no batch describe; sending one image per request")
+            self._batch_ok = False
+            return None
+        try:
+            r.raise_for_status()
+            results = _json.loads(r.content).get("results")
+            if not isinstance(results, list) or len(results) != len(paths):
+                raise ValueError("batch response does not match the request")
         except Exception as e:
-            last_err = e
-            time.sleep(0.2)
-    print(f"[vlm] WARN: describe failed for {image_path_for_vlm}: {last_err}")
-    return None
\ No newline at end of file
+            print(f"[vlm] WARN: batch describe failed ({e}); sending one image per request")
+            return None
+        captions = []
+        for p, res in zip(paths, results):
+            if isinstance(res, dict) and res.get("ok") is False:
+                print(f"[vlm] WARN: describe failed for {p}: {res.get('error')}")
+                res = None
+            captions.append(_caption_from(res) if res is not None else None)
+        return captions
+
+    def _write_loop(self):
+        while True:
+            done = self._out.get()
+            if done is None:
+                return
+            (jpg_path, pose, json_path, _), caption = done
+            if caption:
+                print(f"[vlm] caption: {caption[:120]}{'…' if len(caption) > 120 else ''}")
+            else:
+                print(f"[vlm] WARN: no caption returned for {jpg_path}")
+            try:
+                _update_sidecar_json(json_path, pose, os.path.basename(jpg_path), vlm_text=caption)
+            except Exception as e:
+                print(f"[vlm] ERROR: sidecar {json_path}: {e}")
+
+    def close(self):
+        """Flush everything queued so far (describe + sidecar), then stop both threads."""
+        self._req.put(None)
+        self._sender.join()
+        self._writer.join()
+
+
+_CLIENT: Optional[VLMClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+def get_vlm_client(args) -> VLMClient:
+    """The session-wide VLMClient for args.vlm (created on first use)."""
+    global _CLIENT
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            _CLIENT = VLMClient(args.vlm, args.vlm_timeout, args.vlm_retries,
+                                batch_max=getattr(args, "vlm_batch", 4),
+                                batch_wait=getattr(args, "vlm_batch_wait", 0.05),
+                                path_src=args.vlm_path_src or None, path_dst=args.vlm_path_dst or None)
+        return _CLIENT
+
+def close_vlm_client():
+    global _CLIENT
+    with _CLIENT_LOCK:
+        client, _CLIENT = _CLIENT, None
+    if client is not None:
+        client.close()
@@ -24,19 +24,25 @@ Notes:
 """
 
 from flask import Flask, request, jsonify
-from pathlib import Path
 import os
 import json
 import time
-import glob
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 from collections import deque
+from functools import lru_cache
 import hashlib
-import re
-import urllib.request, urllib.error  # for Jetson2 JSON POST
-import requests                      # for NanoOWL multipart
+import requests                      # Jetson2 JSON POST + NanoOWL multipart + forward-json
+from requests.adapters import HTTPAdapter
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder  # streams uploads from disk
+except ImportError:
+    MultipartEncoder = None
 import cv2                           # for drawing boxes
+import numpy as np
+from json_helper import dumps as _json_dumpb, loads as _json_loadb
 
 app = Flask(__name__)
 
@@ -50,13 +56,35 @@ FORWARD_RETRIES = 3          # Jetson2 prompts retries
 
 NANOOWL_TIMEOUT = 45.0       # NanoOWL infer timeout
 NANOOWL_ANNOTATE = 0         # annotate flag sent to NanoOWL (0/1)
-
-_ANN_RE = re.compile(r"_ann\.(jpg|jpeg|png)$", re.IGNORECASE)
+NANOOWL_COALESCE_S = 0.2     # captions for the same image within this window share one /infer
+
+_ANN_SUFFIXES = ("_ann.jpg", "_ann.jpeg", "_ann.png")  # matched against the lowercased name
+_IMG_EXTS = frozenset({"jpg", "jpeg", "png"})
+
+# Incremental index for _find_latest_image_and_json: per directory, its mtime_ns when last
+# listed, when that listing started, the newest (mtime, path) image directly inside it and its
+# subdirectories. A dir whose mtime is unchanged had no entries added/removed, so only its
+# subdirs are revisited -- unless its mtime falls within _LATEST_RACY_NS of the listing (an
+# entry created in the same timestamp tick would not bump it), in which case it is relisted.
+# The cached best file is re-stat'ed so an in-place rewrite of it is seen; an in-place rewrite
+# of some *other* file does not touch the dir mtime and is only picked up on the next relist.
+_LATEST_CACHE = {"root": None, "dirs": {}}
+_LATEST_LOCK = threading.Lock()
+_LATEST_RACY_NS = 1_000_000_000  # coarse-timestamp filesystems tick in whole seconds
 
 FORWARD_JSON_URL = None       # e.g., http://172.17.16.9:9090/ingest
 FORWARD_JSON_TIMEOUT = 8.0
 FORWARD_JSON_RETRIES = 3
 
+# One pooled keep-alive session for Jetson2, NanoOWL and forward-json: the endpoints repeat on
+# every caption, so reusing connections saves a TCP (and TLS) handshake per call and per retry.
+# Retries stay in the callers (max_retries=0).
+HTTP = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=0)
+HTTP.mount("http://", _HTTP_ADAPTER)
+HTTP.mount("https://", _HTTP_ADAPTER)
+HTTP.headers.update({"Connection": "keep-alive"})
+
 # --- Simple in-memory log/state for quick debugging ---
 HISTORY = deque(maxlen=200)
 LAST = {
@@ -66,57 +94,99 @@ LAST = {
     "last_image_path": None,     # str
     "nanoowl_result": None,      # {"status": int, "body": any}
 }
+_STATE_LOCK = threading.Lock()   # LAST/HISTORY are shared by the server threads
 
-# -------------------- Helpers --------------------
+# Annotation (JPEG decode + draw + re-encode) runs here so /from_vila can respond right away
+_ANN_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="annotate")
 
+# -------------------- Helpers --------------------
 
 def _http_post_json(url: str, payload: dict, timeout: float = 6.0):
     """
-    POST JSON using stdlib (no requests). Returns (status_code, response_text).
+    POST JSON over the shared keep-alive session. Returns (status_code, response_text).
     """
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        url=url,
-        data=data,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
+    data = _json_dumpb(payload)
     try:
-        with urllib.request.urlopen(req, timeout=timeout) as resp:
-            status = getattr(resp, "status", 200)
-            body = resp.read().decode("utf-8", errors="replace")
-            return status, body
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8", errors="replace") if e.fp else str(e)
-        return e.code, body
+        r = HTTP.post(url, data=data, headers={"Content-Type": "application/json"}, timeout=timeout)
+        return r.status_code, r.content.decode("utf-8", errors="replace")
     except Exception as e:
         return -1, str(e)
 
-def _is_in_ann_folder(fp: str) -> bool:
-    p = Path(fp)
-    return any(str(part).lower().endswith("_ann") for part in p.parents)
+def _scan_dir(path: str):
+    """
+    List one directory: newest non-annotated image directly inside it and its subdirs
+    (hidden entries and *_ann folders are skipped, as the old recursive glob did).
+    """
+    best = (-1.0, None)
+    subdirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            name = entry.name
+            if name.startswith("."):
+                continue
+            lname = name.lower()
+            try:
+                if entry.is_dir():
+                    if not lname.endswith("_ann"):
+                        subdirs.append(entry.path)
+                    continue
+                if name.rsplit(".", 1)[-1] not in _IMG_EXTS or lname.endswith(_ANN_SUFFIXES):
+                    continue
+                mtime = entry.stat().st_mtime
+            except OSError:
+                continue
+            if mtime > best[0]:
+                best = (mtime, entry.path)
+    return best, subdirs
+
+def _best_unchanged(best) -> bool:
+    """True if the cached newest image of a dir still exists with the same mtime."""
+    mtime, fp = best
+    if fp is None:
+        return True
+    try:
+        return os.stat(fp).st_mtime == mtime
+    except OSError:
+        return False
 
 def _find_latest_image_and_json(root_dir: str):
     if not root_dir or not os.path.isdir(root_dir):
         return None, None
 
-    patterns = ["**/*.jpg", "**/*.jpeg", "**/*.png"]
-    latest_img = None
-    latest_mtime = -1.0
-
-    for pat in patterns:
-        for fp in glob.glob(os.path.join(root_dir, pat), recursive=True):
-            if _ANN_RE.search(fp):
-                continue
-            if _is_in_ann_folder(fp):
+    with _LATEST_LOCK:
+        if _LATEST_CACHE["root"] != root_dir:
+            _LATEST_CACHE["root"] = root_dir
+            _LATEST_CACHE["dirs"] = {}
+        old = _LATEST_CACHE["dirs"]
+        new = {}
+        latest_mtime, latest_img = -1.0, None
+        stack = [root_dir]
+        while stack:
+            d = stack.pop()
+            if d in new:
                 continue
             try:
-                mtime = os.path.getmtime(fp)
-                if mtime > latest_mtime:
-                    latest_mtime = mtime
-                    latest_img = fp
-            except Exception:
-                pass
+                dir_mtime = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+            cached = old.get(d)
+            if (cached is not None and cached[0] == dir_mtime
+                    and dir_mtime < cached[1] - _LATEST_RACY_NS
+                    and _best_unchanged(cached[2])):
+                entry = cached
+            else:
+                scanned_at = time.time_ns()
+                try:
+                    best, subdirs = _scan_dir(d)
+                except OSError:
+                    continue
+                entry = (dir_mtime, scanned_at, best, subdirs)
+            new[d] = entry
+            mtime, fp = entry[2]
+            if fp is not None and mtime > latest_mtime:
+                latest_mtime, latest_img = mtime, fp
+            stack.extend(entry[3])
+        _LATEST_CACHE["dirs"] = new
 
     if not latest_img:
         return None, None
@@ -126,29 +196,44 @@ def _find_latest_image_and_json(root_dir: str):
     return latest_img, sidecar_json
 
 
+_SIDECAR_LOCK = threading.Lock()  # serializes read-merge-write between server threads
+
 def _update_sidecar_json(json_path: str, updater: dict):
     """
     Safe write/update to sidecar JSON:
       - read existing dict or start a new one
       - merge 'updater' keys
-      - write atomically via *.tmp then replace
+      - skip the write if the serialized result equals what is on disk
+      - otherwise write atomically via *.tmp then replace
     """
-    obj = {}
-    if os.path.isfile(json_path):
+    with _SIDECAR_LOCK:
+        raw_old, obj = None, {}
         try:
-            with open(json_path, "r", encoding="utf-8") as f:
-                obj = json.load(f)
+            with open(json_path, "rb") as f:
+                raw_old = f.read()
+            obj = _json_loadb(raw_old)
+            if not isinstance(obj, dict):
+                obj = {}
+        except FileNotFoundError:
+            pass
         except Exception:
             obj = {}
 
-    # Merge/update top-level keys in-place
-    for k, v in updater.items():
-        obj[k] = v
+        # Merge/update top-level keys in-place
+        for k, v in updater.items():
+            obj[k] = v
+
+        new = _json_dumpb(obj, indent=2)
+        if new == raw_old:
+            return
 
-    tmp = json_path + ".tmp"
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
-    os.replace(tmp, json_path)
+        tmp = json_path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, new)
+        finally:
+            os.close(fd)
+        os.replace(tmp, json_path)
 
 
 def _post_nanoowl_multipart(endpoint: str, image_path: str, prompts: list[str],
@@ -163,10 +248,17 @@ def _post_nanoowl_multipart(endpoint: str, image_path: str, prompts: list[str],
         return -1, "nanoowl endpoint not configured"
     if not (image_path and os.path.isfile(image_path)):
         return -1, f"image not found: {image_path}"
-    files = {"image": (os.path.basename(image_path), open(image_path, "rb"), "application/octet-stream")}
     data = {"prompts": json.dumps(prompts or []), "annotate": str(int(annotate))}
     try:
-        r = requests.post(endpoint, files=files, data=data, timeout=timeout)
+        with open(image_path, "rb") as fh:
+            image = (os.path.basename(image_path), fh, "application/octet-stream")
+            if MultipartEncoder is not None:
+                # body is read from the file in chunks instead of being built in memory
+                enc = MultipartEncoder(fields={**data, "image": image})
+                r = HTTP.post(endpoint, data=enc, headers={"Content-Type": enc.content_type},
+                              timeout=timeout)
+            else:
+                r = HTTP.post(endpoint, files={"image": image}, data=data, timeout=timeout)
         try:
             body = r.json()
         except Exception:
@@ -176,6 +268,60 @@ def _post_nanoowl_multipart(endpoint: str, image_path: str, prompts: list[str],
         return -1, str(e)
 
 
+class _OwlBatch:
+    """Prompts collected for one image during the coalescing window, and the shared result."""
+    def __init__(self):
+        self.prompts = []
+        self.result = None
+        self.done = threading.Event()
+
+_OWL_PENDING = {}                # image_path -> _OwlBatch still collecting prompts
+_OWL_LOCK = threading.Lock()
+
+def _nanoowl_coalesced(image_path: str, prompts: list[str]):
+    """
+    Call NanoOWL once for all captions that target the same image within NANOOWL_COALESCE_S.
+    The first caller (leader) waits out the window, sends the deduped union of prompts and
+    shares the result; later callers block until it is ready.
+    Returns (status, body, merged_prompts, is_leader).
+    """
+    with _OWL_LOCK:
+        batch = _OWL_PENDING.get(image_path)
+        leader = batch is None
+        if leader:
+            batch = _OWL_PENDING[image_path] = _OwlBatch()
+        for p in prompts:
+            if p not in batch.prompts:
+                batch.prompts.append(p)
+
+    if not leader:
+        batch.done.wait()
+        return (*batch.result, False)
+
+    try:
+        if NANOOWL_COALESCE_S > 0:
+            time.sleep(NANOOWL_COALESCE_S)
+        with _OWL_LOCK:
+            del _OWL_PENDING[image_path]
+            merged = list(batch.prompts)
+        status, body = _post_nanoowl_multipart(
+            endpoint=NANOOWL_ENDPOINT,
+            image_path=image_path,
+            prompts=merged,
+            annotate=NANOOWL_ANNOTATE,
+            timeout=NANOOWL_TIMEOUT
+        )
+        batch.result = (status, body, merged)
+    finally:
+        if batch.result is None:
+            with _OWL_LOCK:
+                if _OWL_PENDING.get(image_path) is batch:
+                    del _OWL_PENDING[image_path]
+            batch.result = (-1, "nanoowl call failed", list(batch.prompts))
+        batch.done.set()
+    return (*batch.result, True)
+
+
 def _ann_outpath_for_image(image_path: str) -> str:
     """
     Return output path for annotated image inside a *run-level* folder named <run_dir>_ann.
@@ -191,7 +337,8 @@ def _ann_outpath_for_image(image_path: str) -> str:
     os.makedirs(ann_dir, exist_ok=True)
 
     base_name = os.path.splitext(os.path.basename(image_path))[0]
-    base_name = re.sub(r"_ann$", "", base_name, flags=re.IGNORECASE)
+    if base_name.lower().endswith("_ann"):
+        base_name = base_name[:-4]
     out_name = f"{base_name}_ann.jpg"
 
     return os.path.join(ann_dir, out_name)
@@ -199,14 +346,12 @@ def _ann_outpath_for_image(image_path: str) -> str:
 
 # -------------------- Annotation utilities (OpenCV) --------------------
 
+@lru_cache(maxsize=1024)
 def _color_for_label(label: str):
     """
-    Deterministic BGR color from label string.
+    Deterministic BGR color from label string (memoized: labels repeat across frames).
     """
-    h = hashlib.md5(label.encode("utf-8")).hexdigest()
-    r = int(h[0:2], 16)
-    g = int(h[2:4], 16)
-    b = int(h[4:6], 16)
+    r, g, b = hashlib.md5(label.encode("utf-8")).digest()[:3]
     return (b, g, r)  # OpenCV uses BGR
 
 def _extract_detections(nanoowl_result):
@@ -250,15 +395,18 @@ def _extract_detections(nanoowl_result):
         })
     return norm
 
-def _scale_if_normalized(bbox, W, H):
+def _boxes_to_pixels(dets, W, H):
     """
-    If bbox looks normalized ([0..1]), scale to pixel coordinates.
+    (N,4) int array of clamped pixel boxes for dets. Boxes that look normalized
+    ([0..1] on all four coords) are scaled to W/H first.
     """
-    x1, y1, x2, y2 = bbox
-    if 0.0 <= x1 <= 1.0 and 0.0 <= y1 <= 1.0 and 0.0 <= x2 <= 1.0 and 0.0 <= y2 <= 1.0:
-        x1 *= W; x2 *= W
-        y1 *= H; y2 *= H
-    return int(round(x1)), int(round(y1)), int(round(x2)), int(round(y2))
+    boxes = np.array([d["bbox"] for d in dets], dtype=np.float64).reshape(-1, 4)
+    norm = ((boxes >= 0.0) & (boxes <= 1.0)).all(axis=1)
+    boxes[norm] *= np.array([W, H, W, H], dtype=np.float64)
+    np.rint(boxes, out=boxes)  # half-to-even, same as round()
+    np.clip(boxes[:, 0::2], 0, W - 1, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, H - 1, out=boxes[:, 1::2])
+    return boxes.astype(np.int64)
 
 def _draw_label_box(img, x1, y1, text, color):
     """
@@ -303,12 +451,11 @@ def _annotate_from_json(image_path: str, json_path: str):
         return False
 
     H, W = img.shape[:2]
-    for d in dets:
-        x1, y1, x2, y2 = _scale_if_normalized(d["bbox"], W, H)
-        x1 = max(0, min(W - 1, x1)); x2 = max(0, min(W - 1, x2))
-        y1 = max(0, min(H - 1, y1)); y2 = max(0, min(H - 1, y2))
-        if x2 <= x1 or y2 <= y1:
-            continue
+    boxes = _boxes_to_pixels(dets, W, H)
+    keep = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    for i in np.flatnonzero(keep):
+        d = dets[i]
+        x1, y1, x2, y2 = boxes[i].tolist()
         label = d["label"]
         score = d["score"]
         text  = f"{label}" + (f" {score:.2f}" if isinstance(score, float) else "")
@@ -318,19 +465,41 @@ def _annotate_from_json(image_path: str, json_path: str):
 
     out_path = _ann_outpath_for_image(image_path)
 
-    ok = cv2.imwrite(out_path, img, [int(cv2.IMWRITE_JPEG_QUALITY), 92])
+    # Two captions can resolve to the same latest image and run on different
+    # pool workers; encode in memory and swap the file in atomically so they
+    # never interleave writes to the same <base>_ann.jpg.
+    ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), 92])
     if ok:
+        tmp_path = f"{out_path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(buf.tobytes())
+            os.replace(tmp_path, out_path)
+        except OSError as e:
+            print(f"[annotate][error] failed to write annotated image: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
         print(f"[annotate] wrote {out_path}")
         return True
 
-    print("[annotate][error] failed to write annotated image")
+    print("[annotate][error] failed to encode annotated image")
     return False
 
+def _annotate_job(image_path: str, json_path: str):
+    try:
+        return _annotate_from_json(image_path, json_path)
+    except Exception as e:
+        print(f"[annotate][error] {image_path}: {e}")
+        return False
+
 
 def _load_json(path: str):
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(path, "rb") as f:
+            return _json_loadb(f.read())
     except Exception:
         return None
 
@@ -351,10 +520,10 @@ def _post_full_json(url: str, obj: dict, timeout: float, retries: int = 3, heade
         return -1, "invalid url or payload"
 
     last_status, last_body = None, None
+    data = {"meta": _json_dumpb(obj)}  # serialized once, reused across retries
     for attempt in range(1, int(retries or 1) + 1):
         try:
-            data = {"meta": json.dumps(obj, ensure_ascii=False)}
-            r = requests.post(url, data=data, timeout=timeout, headers=headers or {})
+            r = HTTP.post(url, data=data, timeout=timeout, headers=headers or {})
             try:
                 body = r.json()
             except Exception:
@@ -389,8 +558,9 @@ def from_vila():
 
     ts = int(time.time())
     print(f"[from_vila][{ts}] {caption}")
-    LAST["vila_caption"] = {"ts": ts, "text": caption}
-    HISTORY.appendleft({"src": "vila", "ts": ts, "text": caption})
+    with _STATE_LOCK:
+        LAST["vila_caption"] = {"ts": ts, "text": caption}
+        HISTORY.appendleft({"src": "vila", "ts": ts, "text": caption})
 
     # ---- 1) Send to Jetson2 and wait for prompts ----
     f_status, f_body, prompts = None, None, None
@@ -414,10 +584,12 @@ def from_vila():
         except Exception:
             prompts = None
 
-        LAST["last_forward_status"] = {"status": f_status, "body": f_body}
+        with _STATE_LOCK:
+            LAST["last_forward_status"] = {"status": f_status, "body": f_body}
+            if prompts:
+                LAST["jetson2_prompts"] = {"ts": int(time.time()), "prompts": prompts}
+                HISTORY.appendleft({"src": "jetson2", "ts": int(time.time()), "prompts": prompts})
         if prompts:
-            LAST["jetson2_prompts"] = {"ts": int(time.time()), "prompts": prompts}
-            HISTORY.appendleft({"src": "jetson2", "ts": int(time.time()), "prompts": prompts})
             print(f"[jetson2][prompts] {prompts}")
         else:
             print("[jetson2][warn] no prompts parsed")
@@ -432,7 +604,8 @@ def from_vila():
 
     # ---- 2) Find latest image + sidecar JSON ----
     img_path, json_path = _find_latest_image_and_json(CAPTURES_ROOT)
-    LAST["last_image_path"] = img_path
+    with _STATE_LOCK:
+        LAST["last_image_path"] = img_path
     if not img_path:
         print(f"[nanoowl][warn] no image found under {CAPTURES_ROOT}")
         return jsonify({
@@ -444,15 +617,24 @@ def from_vila():
         base, _ = os.path.splitext(img_path)
         json_path = base + ".json"
 
-    # ---- 3) Call NanoOWL ----
-    status, body = _post_nanoowl_multipart(
-        endpoint=NANOOWL_ENDPOINT,
-        image_path=img_path,
-        prompts=prompts,
-        annotate=NANOOWL_ANNOTATE,
-        timeout=NANOOWL_TIMEOUT
-    )
-    LAST["nanoowl_result"] = {"status": status, "body": body if not isinstance(body, str) else body[:2000]}
+    # ---- 3) Call NanoOWL (bursts for the same image share one call) ----
+    status, body, owl_prompts, leader = _nanoowl_coalesced(img_path, prompts)
+    if not leader:
+        # the leader request writes the sidecar, forwards and annotates for the whole burst
+        print(f"[nanoowl] coalesced into shared call status={status}")
+        return jsonify({
+            "ok": True,
+            "caption": caption,
+            "prompts": prompts,
+            "image_path": img_path,
+            "nanoowl_status": status,
+            "nanoowl_body": body,
+            "sidecar_json": json_path,
+            "annotated": "queued",
+            "coalesced": True
+        })
+    with _STATE_LOCK:
+        LAST["nanoowl_result"] = {"status": status, "body": body if not isinstance(body, str) else body[:2000]}
     print(f"[nanoowl] status={status} body_type={'json' if isinstance(body, dict) else 'text'}")
 
     # ---- 4) Write NanoOWL result to sidecar JSON ----
@@ -463,7 +645,7 @@ def from_vila():
         "iso_time": iso,
         "endpoint": NANOOWL_ENDPOINT,
         "status": status,
-        "prompts": prompts,
+        "prompts": owl_prompts,
         "annotate": int(NANOOWL_ANNOTATE),
         "result": body
     }
@@ -501,8 +683,8 @@ def from_vila():
     except Exception as e:
         print(f"[nanoowl][json][error] failed to update {json_path}: {e}")
 
-    # ---- 5) **Auto-annotate** and write <basename>_ann.jpg ----
-    ann_ok = _annotate_from_json(img_path, json_path)
+    # ---- 5) **Auto-annotate** and write <basename>_ann.jpg (in the background) ----
+    _ANN_POOL.submit(_annotate_job, img_path, json_path)
 
     return jsonify({
         "ok": True,
@@ -512,13 +694,15 @@ def from_vila():
         "nanoowl_status": status,
         "nanoowl_body": body,
         "sidecar_json": json_path,
-        "annotated": bool(ann_ok)
+        "annotated": "queued"
     })
 
 
 @app.get("/latest")
 def latest():
-    return jsonify({"ok": True, "last": LAST})
+    with _STATE_LOCK:
+        last = dict(LAST)
+    return jsonify({"ok": True, "last": last})
 
 
 @app.get("/health")
@@ -530,11 +714,13 @@ def health():
 
 def main():
     global JETSON2_ENDPOINT, NANOOWL_ENDPOINT, CAPTURES_ROOT
-    global FORWARD_TIMEOUT, FORWARD_RETRIES, NANOOWL_TIMEOUT, NANOOWL_ANNOTATE
+    global FORWARD_TIMEOUT, FORWARD_RETRIES, NANOOWL_TIMEOUT, NANOOWL_ANNOTATE, NANOOWL_COALESCE_S
 
     p = argparse.ArgumentParser()
     p.add_argument("--host", default="0.0.0.0")
     p.add_argument("--port", type=int, default=5050)
+    p.add_argument("--server-threads", type=int, default=8,
+                   help="Worker threads: each /from_vila request blocks one while it waits on Jetson2/NanoOWL")
 
     p.add_argument("--jetson2-endpoint", required=True,
                    help="URL to Jetson-2 prompts endpoint, e.g. http://172.16.17.11:5050/prompts")
@@ -552,6 +738,8 @@ def main():
                    help="Timeout (sec) for NanoOWL POST")
     p.add_argument("--nanoowl-annotate", type=int, default=0,
                    help="Pass annotate=0/1 to NanoOWL")
+    p.add_argument("--nanoowl-coalesce-ms", type=float, default=200.0,
+                   help="Captions for the same image arriving within this window share one NanoOWL call (0 = off)")
 
 
     p.add_argument("--forward-json-url", default="http://172.17.16.9:9090/ingest",
@@ -571,6 +759,7 @@ def main():
     FORWARD_RETRIES = args.forward_retries
     NANOOWL_TIMEOUT = args.nanoowl_timeout
     NANOOWL_ANNOTATE = int(args.nanoowl_annotate)
+    NANOOWL_COALESCE_S = max(0.0, args.nanoowl_coalesce_ms) / 1000.0
 
     global FORWARD_JSON_URL, FORWARD_JSON_TIMEOUT, FORWARD_JSON_RETRIES
     FORWARD_JSON_URL = (args.forward_json_url or "").strip()
@@ -582,7 +771,16 @@ def main():
     print(f"  captures_root    = {CAPTURES_ROOT}")
     print(f"  nanoowl_endpoint = {NANOOWL_ENDPOINT} (annotate={NANOOWL_ANNOTATE})")
 
-    app.run(host=args.host, port=args.port)
+    # waitress if installed (threaded production WSGI), else the threaded Werkzeug server;
+    # either way concurrent captions overlap their network waits instead of queueing.
+    try:
+        from waitress import serve
+    except ImportError:
+        serve = None
+    if serve is not None:
+        serve(app, host=args.host, port=args.port, threads=max(1, args.server_threads))
+    else:
+        app.run(host=args.host, port=args.port, threaded=True)
 
 
 if __name__ == "__main__":
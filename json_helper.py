@@ -0,0 +1,24 @@
+"""
+JSON adapter shared by capture/, comm_manager_2.py and VILA/__main__.py: orjson when
+installed, stdlib json otherwise. Both return/accept UTF-8 bytes so callers can read/write
+files in binary mode. Lives at the repo root; capture/ and VILA/ put the root on sys.path.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj, indent=None) -> bytes:
+    """UTF-8 JSON bytes; orjson when available (it only does indent 2), stdlib json otherwise."""
+    if orjson is not None and indent in (None, 2):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if indent else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, ensure_ascii=False, indent=indent).encode("utf-8")
+
+
+def loads(data):
+    """Parse bytes/str produced by dumps() (or any JSON document)."""
+    return orjson.loads(data) if orjson is not None else json.loads(data)